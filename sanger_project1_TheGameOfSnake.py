@@ -1,7 +1,20 @@
 from __future__ import annotations
-import dudraw
-from dudraw import Color
+import math
+import os
 import random
+import struct
+import sys
+import time
+from array import array
+from collections import deque
+#dudraw is only needed by the interactive front end (main), so the game engine can be imported
+#and run headless (tests, bots, batch jobs) on machines that don't have it installed
+try:
+    import dudraw
+    from dudraw import Color
+except ImportError:
+    dudraw = None
+    Color = None
 
 """
     A program that uses dudraw to make the classic "snake" game
@@ -21,6 +34,9 @@ import random
 # next: reference to the next node
 # prev: reference to the previous node in the list
 class Node:
+    #__slots__ keeps each node small and skips the per-instance dictionary
+    __slots__ = ('value', 'prev', 'next')
+
     def __init__(self, v, p, n):
         self.value = v
         self.prev = p
@@ -42,6 +58,10 @@ class DoublyLinkedList:
         #make header point to trailer
         self.header.next = self.trailer
         self.size = 0
+        #the finger remembers the last node found by index, so walking through the list by index doesn't start over
+        #every time. Any change to the links clears it
+        self.finger = None
+        self.finger_index = -1
     
     #this method prints the doubly linked list for debugging purposes
     def __str__(self):
@@ -59,6 +79,36 @@ class DoublyLinkedList:
         #return the result string plus the last value
         return result + str(temp) + "]"
 
+    #lets the list be used in a for loop, stepping through the values from first to last
+    def __iter__(self):
+        temp = self.header.next
+        while temp is not self.trailer:
+            yield temp.value
+            temp = temp.next
+
+    #lets the list be used with reversed(), stepping through the values from last to first
+    def __reversed__(self):
+        temp = self.trailer.prev
+        while temp is not self.header:
+            yield temp.value
+            temp = temp.prev
+
+    #lets len() be used on the list
+    def __len__(self):
+        return self.size
+
+    #lets the list be indexed like a python list: list[i], list[-1] and slices like list[2:5] (which return a new list)
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            result = DoublyLinkedList()
+            #the finger makes each step from one index to the next short
+            for index in range(*i.indices(self.size)):
+                result.add_last(self.get(index))
+            return result
+        if i < 0:
+            i += self.size
+        return self.get(i)
+
     #method that returns whether or not the list is empty
     def is_empty(self):
         return self.size == 0
@@ -93,8 +143,9 @@ class DoublyLinkedList:
         n1.next = new_node
         n2.prev = new_node
 
-        #step 3: increment size
+        #step 3: increment size (and clear the finger, since indexes have shifted)
         self.size += 1
+        self.finger = None
 
     def add_first(self, v):
         """
@@ -131,8 +182,9 @@ class DoublyLinkedList:
         node1.next = node2
         node2.prev = node1
 
-        #decrement size
+        #decrement size (and clear the finger, since indexes have shifted)
         self.size -= 1
+        self.finger = None
         return value_to_return
     
     #method that utilizes the remove_between() method and removes/returns the first value
@@ -143,6 +195,26 @@ class DoublyLinkedList:
     def remove_last(self):
         return self.remove_between(self.trailer.prev.prev, self.trailer)
     
+    #method that moves the last node to the front of the list and returns its value
+    #the node is relinked instead of removed and re-added, so nothing is allocated and the caller can reuse the value
+    def move_last_to_first(self):
+        if self.size == 0:
+            raise ValueError("List is empty")
+        node = self.trailer.prev
+        #with a single node, the last node is already the first
+        if node is self.header.next:
+            return node.value
+        self.finger = None
+        #unlink the node from the end of the list
+        node.prev.next = self.trailer
+        self.trailer.prev = node.prev
+        #link it back in between the header and the old first node
+        node.prev = self.header
+        node.next = self.header.next
+        self.header.next.prev = node
+        self.header.next = node
+        return node.value
+
     #method that searches for a specific value in the list and returns the index, (parameter v)
     #if not found, returns -1
     def search(self, v):
@@ -161,25 +233,181 @@ class DoublyLinkedList:
         #if we exit the loop, we didn't find the value. Return -1
         return -1
     
-    #method that returns the value at the given index (param i) in the list
-    def get(self, i):
+    #method that returns the node at the given index (param i) in the list
+    def node_at(self, i):
         #add a check to make sure the index is valid
         if i < 0 or i >= self.size:
             raise IndexError("Invalid Index")
-        #step through the loop with a temp node, and make a variable to keep track of the index
-        temp = self.header.next
-        index = 0
-        #continue to step while the index is not the passed index from the parameter
-        while index != i:
+        #start from whichever of the header (index -1), the trailer (index size) or the finger is closest to i
+        temp = self.header
+        index = -1
+        if self.size - i < i + 1:
+            temp = self.trailer
+            index = self.size
+        if self.finger is not None and abs(i - self.finger_index) < abs(i - index):
+            temp = self.finger
+            index = self.finger_index
+        #step forwards or backwards until we reach the passed index from the parameter
+        while index < i:
             temp = temp.next
             index += 1
-        #if we exit the loop, we have found the right index. Return the value at the index
-        return temp.value
+        while index > i:
+            temp = temp.prev
+            index -= 1
+        #remember where we ended up, so the next lookup near this index is quick
+        self.finger = temp
+        self.finger_index = i
+        return temp
+
+    #method that returns the value at the given index (param i) in the list
+    def get(self, i):
+        return self.node_at(i).value
+
+    #adds every value from the iterable v to the tail of the list
+    def extend(self, v):
+        #copy the values first in case the list is being extended with itself
+        if v is self:
+            v = list(v)
+        for value in v:
+            self.add_last(value)
+
+    def splice(self, other: DoublyLinkedList, i = None):
+        """
+            parameters:
+                other: another DoublyLinkedList, which is left empty afterwards
+                i: the index the first node of other should end up at (defaults to the end of this list)
+            return:
+                None
+            moves all of the nodes of other into this list in one go, by relinking the two ends of other
+            instead of copying its values one at a time
+        """
+        if other is self:
+            raise ValueError("Can't splice a list into itself")
+        if i is None:
+            i = self.size
+        if i < 0 or i > self.size:
+            raise IndexError("Invalid Index")
+        if other.size == 0:
+            return
+        #find the nodes the other list goes between
+        after = self.trailer if i == self.size else self.node_at(i)
+        before = after.prev
+        #link the first and last nodes of the other list in between them
+        before.next = other.header.next
+        other.header.next.prev = before
+        after.prev = other.trailer.prev
+        other.trailer.prev.next = after
+        self.size += other.size
+        self.finger = None
+        #the other list no longer owns any nodes
+        other.header.next = other.trailer
+        other.trailer.prev = other.header
+        other.size = 0
+        other.finger = None
+
+#the size of the world, in squares
+GRID_WIDTH = 20
+GRID_HEIGHT = 20
+
+#an occupancy grid over the world that counts how many snake segments cover each square
+#squares are addressed by the (x, y) center of the square, the same way SnakeSegment stores its position
+#the snake updates it as it moves and grows, so checking a square is constant time no matter how long the snake is
+#the grid also keeps an index of the empty squares, so a random empty square can be picked in constant time at any fill level
+class Grid:
+    def __init__(self, width: int = GRID_WIDTH, height: int = GRID_HEIGHT):
+        self.width = width
+        self.height = height
+        self.clear()
+
+    #empties every square, leaving the grid just like a new one (SnakeGame.reset reuses its grid this way)
+    def clear(self):
+        #one counter per square, stored row by row
+        self.cells = bytearray(self.width * self.height)
+        #free holds the index of every empty square in no particular order, and free_pos maps each square to its position
+        #in free (-1 when the square is covered). Removing a square swaps the last entry of free into its place
+        self.free = squares_in_order(self.width * self.height)
+        self.free_pos = squares_in_order(self.width * self.height)
+        #when a renderer sets changed to a list, the index of every square that becomes covered or empty is added to it
+        #(None means nobody is watching, so nothing is recorded)
+        self.changed = None
+
+    #method that returns whether or not the point (x, y) lies inside the world
+    def in_bounds(self, x, y):
+        return 0 < x < self.width and 0 < y < self.height
+
+    #method that returns the number of segments covering the square at (x, y). squares outside the world are never covered
+    def count(self, x, y):
+        if 0 < x < self.width and 0 < y < self.height:
+            return self.cells[int(y) * self.width + int(x)]
+        return 0
+
+    #method that returns the number of empty squares in the world
+    def free_count(self):
+        return len(self.free)
+
+    #method that records a segment covering the square at (x, y). segments outside the world aren't tracked
+    def occupy(self, x, y):
+        if 0 < x < self.width and 0 < y < self.height:
+            index = int(y) * self.width + int(x)
+            self.cells[index] += 1
+            if self.cells[index] == 1:
+                #the square just became covered: swap the last free square into its slot and shrink the free list
+                position = self.free_pos[index]
+                moved = self.free.pop()
+                if moved != index:
+                    self.free[position] = moved
+                    self.free_pos[moved] = position
+                self.free_pos[index] = -1
+                if self.changed is not None:
+                    self.changed.append(index)
+
+    #method that records a segment leaving the square at (x, y)
+    def vacate(self, x, y):
+        if 0 < x < self.width and 0 < y < self.height:
+            index = int(y) * self.width + int(x)
+            self.cells[index] -= 1
+            if self.cells[index] == 0:
+                #the square just became empty, so add it to the end of the free list
+                self.free_pos[index] = len(self.free)
+                self.free.append(index)
+                if self.changed is not None:
+                    self.changed.append(index)
+
+    def random_free_square(self, rng = random):
+        """
+            parameters:
+                rng: the random number generator to draw from
+            return:
+                the (x, y) center of an empty square chosen uniformly at random, or None if every square is covered
+        """
+        if len(self.free) == 0:
+            return None
+        index = self.free[rng.randrange(len(self.free))]
+        return (index % self.width + 0.5, index // self.width + 0.5)
+
+#the indexes 0, 1, 2, ... of the squares of the biggest world made so far. New grids copy the start of it instead of
+#counting up in python, which on a 4096x4096 world is a copy of 64 MB (about 50 ms) instead of more than a second
+square_indexes = array('i')
+
+#returns a new array('i') holding 0, 1, ..., size - 1
+def squares_in_order(size: int):
+    global square_indexes
+    if len(square_indexes) < size:
+        square_indexes = array('i', range(size))
+    return square_indexes[:size]
+
+#the default color of every snake segment (None when running headless without dudraw)
+SEGMENT_COLOR = Color(0, 255, 0) if Color is not None else None
+
+#maps the movement keys of the interactive game to the direction the snake should turn
+KEY_DIRECTIONS = {'w': 'up', 'a': 'left', 's': 'down', 'd': 'right'}
 
 #a SnakeSegment object that is to be stored in each node of the linked list
 class SnakeSegment:
+    __slots__ = ('x_loc', 'y_loc', 'color')
+
     #construct each segment to keep track of it's position, as well as a color value
-    def __init__(self, x: float, y: float, color: Color = Color(0,255,0)):
+    def __init__(self, x: float, y: float, color: Color = SEGMENT_COLOR):
         self.x_loc = x
         self.y_loc = y
         self.color = color
@@ -189,70 +417,335 @@ class SnakeSegment:
         dudraw.set_pen_color(self.color)
         dudraw.filled_square(self.x_loc, self.y_loc, 0.5)
 
+#a view of one slot in a SegmentRingBuffer that acts like a SnakeSegment
+#reading or writing x_loc/y_loc reads or writes the buffer itself. A view is only valid until the buffer is next changed
+class RingSegment:
+    __slots__ = ('ring', 'slot')
+
+    def __init__(self, ring: SegmentRingBuffer, slot: int):
+        self.ring = ring
+        self.slot = slot
+
+    @property
+    def x_loc(self):
+        return self.ring.xs[self.slot] + 0.5
+
+    @x_loc.setter
+    def x_loc(self, x):
+        self.ring.xs[self.slot] = int(x - 0.5)
+
+    @property
+    def y_loc(self):
+        return self.ring.ys[self.slot] + 0.5
+
+    @y_loc.setter
+    def y_loc(self, y):
+        self.ring.ys[self.slot] = int(y - 0.5)
+
+    #every segment in a ring buffer is drawn in the default color
+    @property
+    def color(self):
+        return SEGMENT_COLOR
+
+    def __str__(self):
+        return f"({self.x_loc}, {self.y_loc})"
+
+    draw = SnakeSegment.draw
+
+#a compact body for the snake: a ring buffer of segment positions stored in two preallocated integer arrays
+#it has the same methods the Snake uses on a DoublyLinkedList, but get(i) is constant time and each segment only takes
+#8 bytes instead of a Node, a SnakeSegment and its two floats (about 160 bytes, even with __slots__ on both classes).
+#positions are stored as the lower-left corner of the square (x_loc - 0.5), since every segment sits in the middle of a square
+class SegmentRingBuffer:
+    def __init__(self, capacity: int = 64):
+        #keep the capacity a power of two so wrapping around is a bitwise and
+        self.capacity = 1
+        while self.capacity < capacity:
+            self.capacity *= 2
+        self.xs = array('i', bytes(4 * self.capacity))
+        self.ys = array('i', bytes(4 * self.capacity))
+        #start is the slot of the first segment, and the rest follow it (wrapping around the end of the arrays)
+        self.start = 0
+        self.size = 0
+
+    #this method prints the ring buffer for debugging purposes
+    def __str__(self):
+        return "[" + " ".join(str(segment) for segment in self) + "]"
+
+    #lets the ring buffer be used in a for loop, stepping through the segments from first to last
+    def __iter__(self):
+        for i in range(self.size):
+            yield RingSegment(self, (self.start + i) & (self.capacity - 1))
+
+    #lets the ring buffer be used with reversed(), stepping through the segments from last to first
+    def __reversed__(self):
+        for i in range(self.size - 1, -1, -1):
+            yield RingSegment(self, (self.start + i) & (self.capacity - 1))
+
+    #lets len() be used on the ring buffer
+    def __len__(self):
+        return self.size
+
+    #lets the ring buffer be indexed like a python list: buffer[i], buffer[-1] and slices like buffer[2:5]
+    #(which return a new ring buffer with copies of the positions, like DoublyLinkedList's slices return a new list)
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            indexes = range(*i.indices(self.size))
+            result = SegmentRingBuffer(len(indexes))
+            for index in indexes:
+                slot = (self.start + index) & (self.capacity - 1)
+                result.xs[result.size] = self.xs[slot]
+                result.ys[result.size] = self.ys[slot]
+                result.size += 1
+            return result
+        if i < 0:
+            i += self.size
+        return self.get(i)
+
+    #method that returns whether or not the ring buffer is empty
+    def is_empty(self):
+        return self.size == 0
+
+    #method that returns the number of segments in the ring buffer
+    def get_size(self):
+        return self.size
+
+    #doubles the capacity when the buffer is full, copying the segments to the front of the new arrays
+    def _grow(self):
+        xs = array('i', bytes(8 * self.capacity))
+        ys = array('i', bytes(8 * self.capacity))
+        for i in range(self.size):
+            slot = (self.start + i) & (self.capacity - 1)
+            xs[i] = self.xs[slot]
+            ys[i] = self.ys[slot]
+        self.xs = xs
+        self.ys = ys
+        self.start = 0
+        self.capacity *= 2
+
+    #method that returns the first segment
+    def first(self):
+        if self.size == 0:
+            raise ValueError("List is empty")
+        return RingSegment(self, self.start)
+
+    #method that returns the last segment
+    def last(self):
+        if self.size == 0:
+            raise ValueError("List is empty")
+        return RingSegment(self, (self.start + self.size - 1) & (self.capacity - 1))
+
+    #method that returns the segment at the given index (param i). Unlike the linked list, this is constant time
+    def get(self, i):
+        if i < 0 or i >= self.size:
+            raise IndexError("Invalid Index")
+        return RingSegment(self, (self.start + i) & (self.capacity - 1))
+
+    #adds a segment at the position of v (anything with x_loc and y_loc) to the head of the buffer
+    def add_first(self, v):
+        if self.size == self.capacity:
+            self._grow()
+        self.start = (self.start - 1) & (self.capacity - 1)
+        self.xs[self.start] = int(v.x_loc - 0.5)
+        self.ys[self.start] = int(v.y_loc - 0.5)
+        self.size += 1
+
+    #adds a segment at the position of v (anything with x_loc and y_loc) to the tail of the buffer
+    def add_last(self, v):
+        if self.size == self.capacity:
+            self._grow()
+        slot = (self.start + self.size) & (self.capacity - 1)
+        self.xs[slot] = int(v.x_loc - 0.5)
+        self.ys[slot] = int(v.y_loc - 0.5)
+        self.size += 1
+
+    #removes the first segment and returns it as a new SnakeSegment
+    def remove_first(self):
+        if self.size == 0:
+            raise ValueError("List is empty")
+        removed = SnakeSegment(self.xs[self.start] + 0.5, self.ys[self.start] + 0.5)
+        self.start = (self.start + 1) & (self.capacity - 1)
+        self.size -= 1
+        return removed
+
+    #removes the last segment and returns it as a new SnakeSegment
+    def remove_last(self):
+        if self.size == 0:
+            raise ValueError("List is empty")
+        slot = (self.start + self.size - 1) & (self.capacity - 1)
+        self.size -= 1
+        return SnakeSegment(self.xs[slot] + 0.5, self.ys[slot] + 0.5)
+
+    #method that moves the last segment to the front and returns it, like DoublyLinkedList.move_last_to_first
+    def move_last_to_first(self):
+        if self.size == 0:
+            raise ValueError("List is empty")
+        last = (self.start + self.size - 1) & (self.capacity - 1)
+        self.start = (self.start - 1) & (self.capacity - 1)
+        #when the buffer is full, the slot before the first one is the last slot, so there is nothing to copy
+        if self.start != last:
+            self.xs[self.start] = self.xs[last]
+            self.ys[self.start] = self.ys[last]
+        return RingSegment(self, self.start)
+
+#a bounded queue of turns waiting to be applied to a snake, one per move
+#turns are checked against the last queued direction when they're added, so two quick key presses (like w then a)
+#both happen on consecutive moves instead of the second one overwriting the first, and a turn that would reverse
+#the snake onto itself is rejected. It also measures the latency from a turn being queued to the move that applies it
+class TurnQueue:
+    def __init__(self, capacity: int = 3, clock = time.monotonic):
+        self.capacity = capacity
+        self.clock = clock
+        #the queued (direction, time queued) pairs, oldest first
+        self.pending = deque()
+        #latency statistics, in seconds
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.applied = 0
+
+    def push(self, direction, current_direction):
+        """
+            parameters:
+                direction: the direction to turn ('up', 'down', 'left' or 'right')
+                current_direction: the direction the snake is moving in right now
+            return:
+                True if the turn was queued, False if it was rejected (queue full, or not a turn from the
+                direction the snake will be moving in by then)
+        """
+        if len(self.pending) >= self.capacity:
+            return False
+        previous = self.pending[-1][0] if self.pending else current_direction
+        #only turns perpendicular to the previous direction are allowed, which rules out reversals and repeats
+        if direction in ('up', 'down') and previous in ('left', 'right') or direction in ('left', 'right') and previous in ('up', 'down'):
+            self.pending.append((direction, self.clock()))
+            return True
+        return False
+
+    #removes and returns the oldest queued direction, recording how long it waited
+    def pop(self):
+        direction, queued_at = self.pending.popleft()
+        latency = self.clock() - queued_at
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+        self.applied += 1
+        return direction
+
+    #method that returns the average time from queuing a turn to the move that applied it
+    def mean_latency(self):
+        return self.total_latency / self.applied if self.applied else 0.0
+
+    #throws away any turns that haven't been applied yet
+    def clear(self):
+        self.pending.clear()
+
 #a Snake object that will be our snake on the screen
 class Snake:
-    def __init__(self):
-        #make the body be a DoublyLinkedList object
-        self.body = DoublyLinkedList()
-        #initialize the snake to start with three segments in the right-lower corner of the screen
-        self.body.add_first(SnakeSegment(12.5, 8.5))
-        self.body.add_last(SnakeSegment(12.5, 7.5))
-        self.body.add_last(SnakeSegment(12.5, 6.5))
+    #body_class picks how the body is stored: DoublyLinkedList (the default) or SegmentRingBuffer
+    #width and height are the size of the world the snake lives in, in squares
+    #grid is an occupancy grid to share with other snakes (see snake_arena.py), and squares and direction give the
+    #(x, y) centers of the starting body from the head back and the starting direction instead of the usual start
+    def __init__(self, body_class = None, width: int = GRID_WIDTH, height: int = GRID_HEIGHT, grid: Grid = None,
+                 squares = None, direction: str = 'up'):
+        #make the body be a DoublyLinkedList object, unless another body class was asked for
+        self.body = DoublyLinkedList() if body_class is None else body_class()
+        #the occupancy grid keeps track of which cells the body covers, so crash checks don't have to walk the body
+        self.grid = Grid(width, height) if grid is None else grid
+        #initialize the snake to start with three segments in the right-lower part of the screen
+        #(on the 20x20 world that is the squares centered at (12.5, 8.5), (12.5, 7.5) and (12.5, 6.5))
+        if squares is None:
+            start_x = width * 3 // 5 + 0.5
+            start_y = height * 2 // 5 + 0.5
+            squares = [(start_x, start_y - i) for i in range(3)]
+        for x, y in squares:
+            self.body.add_last(SnakeSegment(x, y))
+            self.grid.occupy(x, y)
         #initialize the direction to be up
-        self.direction = 'up'
+        self.direction = direction
+        #turns waiting to be applied, one per move (see queue_turn)
+        self.turns = TurnQueue()
+
+    #a method that changes the direction of the snake, returning whether or not the turn was accepted
+    #only turns perpendicular to the current direction are allowed, so the user can't accidentally turn back on theirself
+    def turn(self, direction):
+        if direction in ('up', 'down') and self.direction in ('left', 'right'):
+            self.direction = direction
+            return True
+        if direction in ('left', 'right') and self.direction in ('up', 'down'):
+            self.direction = direction
+            return True
+        return False
     
+    #a method that buffers a turn to be applied on the next move that doesn't already have one, returning whether it was queued
+    def queue_turn(self, direction):
+        if self.direction is None:
+            return False
+        return self.turns.push(direction, self.direction)
+
     #create a draw method which draws all the segments of the snake
     def draw(self):
-        #create a temp node to step through the list. start at the first value
-        temp = self.body.header.next
-        #step all the way through the list
-        while temp is not self.body.trailer:
-            #if the current node is the first value:
-            if temp is self.body.header.next:
-                #call the SnakeSegment's draw method, then set the pen color to red for eyes and tongue
-                temp.value.draw()
-                dudraw.set_pen_color(dudraw.RED)
-                #check which direction the snake is going:
-                #for each case, draw the snake "face" in the right orientation so it looks natural when the snake turns
-                if self.direction == 'up':
-                    dudraw.filled_circle(temp.value.x_loc - 0.25, temp.value.y_loc + 0.15, 0.05)
-                    dudraw.filled_circle(temp.value.x_loc + 0.25, temp.value.y_loc + 0.15, 0.05)
-                    dudraw.filled_rectangle(temp.value.x_loc, temp.value.y_loc + 0.8, 0.1, 0.3)
-                elif self.direction == 'down':
-                    dudraw.filled_circle(temp.value.x_loc - 0.25, temp.value.y_loc - 0.15, 0.05)
-                    dudraw.filled_circle(temp.value.x_loc + 0.25, temp.value.y_loc - 0.15, 0.05)
-                    dudraw.filled_rectangle(temp.value.x_loc, temp.value.y_loc - 0.8, 0.1, 0.3)
-                elif self.direction == 'left':
-                    dudraw.filled_circle(temp.value.x_loc - 0.15, temp.value.y_loc -0.25, 0.05)
-                    dudraw.filled_circle(temp.value.x_loc - 0.15, temp.value.y_loc + 0.25, 0.05)
-                    dudraw.filled_rectangle(temp.value.x_loc - 0.8, temp.value.y_loc, 0.3, 0.1)
-                elif self.direction == 'right':
-                    dudraw.filled_circle(temp.value.x_loc + 0.15, temp.value.y_loc -0.25, 0.05)
-                    dudraw.filled_circle(temp.value.x_loc + 0.15, temp.value.y_loc + 0.25, 0.05)
-                    dudraw.filled_rectangle(temp.value.x_loc + 0.8, temp.value.y_loc, 0.3, 0.1)
-            #otherwise, draw the segment normally
-            else:
-                temp.value.draw()
-            #after the segment is drawn, move onto the next
-            temp = temp.next
+        #step all the way through the body, starting at the first segment
+        first = True
+        for segment in self.body:
+            segment.draw()
+            #the first segment is the head, so draw the snake "face" on top of it
+            if first:
+                self.draw_face(segment.x_loc, segment.y_loc)
+                first = False
+
+    #draws the eyes and tongue of a head at (x, y) in red
+    def draw_face(self, x, y):
+        dudraw.set_pen_color(dudraw.RED)
+        #check which direction the snake is going:
+        #for each case, draw the snake "face" in the right orientation so it looks natural when the snake turns
+        if self.direction == 'up':
+            dudraw.filled_circle(x - 0.25, y + 0.15, 0.05)
+            dudraw.filled_circle(x + 0.25, y + 0.15, 0.05)
+            dudraw.filled_rectangle(x, y + 0.8, 0.1, 0.3)
+        elif self.direction == 'down':
+            dudraw.filled_circle(x - 0.25, y - 0.15, 0.05)
+            dudraw.filled_circle(x + 0.25, y - 0.15, 0.05)
+            dudraw.filled_rectangle(x, y - 0.8, 0.1, 0.3)
+        elif self.direction == 'left':
+            dudraw.filled_circle(x - 0.15, y -0.25, 0.05)
+            dudraw.filled_circle(x - 0.15, y + 0.25, 0.05)
+            dudraw.filled_rectangle(x - 0.8, y, 0.3, 0.1)
+        elif self.direction == 'right':
+            dudraw.filled_circle(x + 0.15, y -0.25, 0.05)
+            dudraw.filled_circle(x + 0.15, y + 0.25, 0.05)
+            dudraw.filled_rectangle(x + 0.8, y, 0.3, 0.1)
+
     #create a move method to advance the snake one "square"
     def move(self):
+        #apply the next buffered turn, if there is one (turn() checks it against the current direction again)
+        if self.turns.pending and self.direction is not None:
+            self.turn(self.turns.pop())
+        #figure out how far the head moves in x and y for the current direction
         if self.direction == 'up':
-            #add a segment on top of the current first segment, then remove the last segment
-            self.body.add_first(SnakeSegment(self.body.first().x_loc, self.body.first().y_loc + 1))
-            self.body.remove_last()
+            change_x, change_y = 0, 1
         elif self.direction == 'left':
-            #add a segment to the left of the current first segment, then remove the last segment
-            self.body.add_first(SnakeSegment(self.body.first().x_loc - 1, self.body.first().y_loc))
-            self.body.remove_last()
+            change_x, change_y = -1, 0
         elif self.direction == 'down':
-            #add a segment below the current first segment, then remove the last segment
-            self.body.add_first(SnakeSegment(self.body.first().x_loc, self.body.first().y_loc - 1))
-            self.body.remove_last()
+            change_x, change_y = 0, -1
         elif self.direction == 'right':
-            #add a segment to the right of the current first segment, then remove the last segment
-            self.body.add_first(SnakeSegment(self.body.first().x_loc + 1, self.body.first().y_loc))
-            self.body.remove_last()
+            change_x, change_y = 1, 0
+        else:
+            #the snake is stopped (the game is over), so it doesn't move
+            return
+        #free up the last segment's cell on the grid first, so the head may move into the cell the tail just left
+        tail = self.body.last()
+        self.grid.vacate(tail.x_loc, tail.y_loc)
+        #the new first segment goes next to the current first segment in the direction of travel
+        head = self.body.first()
+        new_x = head.x_loc + change_x
+        new_y = head.y_loc + change_y
+        #instead of adding a new segment and throwing the last one away, move the last segment to the front and give it
+        #the new position. This way moving never allocates a node or a segment
+        segment = self.body.move_last_to_first()
+        segment.x_loc = new_x
+        segment.y_loc = new_y
+        self.grid.occupy(new_x, new_y)
 
     #a method that determines if the snake has encountered food
     def has_found_food(self, other: Food):
@@ -269,9 +762,10 @@ class Snake:
         #in order to add a new segment in the correct orientation, we need to look at the last two segments and determine the change in direction
         #this allows us to know which way the last two segments are moving
         #subtract the last segment's x value from the second to last's
-        change_x = self.body.trailer.prev.prev.value.x_loc - self.body.last().x_loc
+        second_to_last = self.body[-2]
+        change_x = second_to_last.x_loc - self.body.last().x_loc
         #subtract the last segment's y value from the second to last's
-        change_y = self.body.trailer.prev.prev.value.y_loc - self.body.last().y_loc
+        change_y = second_to_last.y_loc - self.body.last().y_loc
         #if the y change is positive, we know we need to add the segment below the last
         if change_y > 0:
             self.body.add_last(SnakeSegment(self.body.last().x_loc, self.body.last().y_loc - 1))
@@ -284,30 +778,29 @@ class Snake:
         #if the x change is positive, we know we need to add the segment to the left of the last
         elif change_x > 0:
             self.body.add_last(SnakeSegment(self.body.last().x_loc - 1, self.body.last().y_loc))
-    
+        #if the last two segments are on the same square there's no way to tell which way to grow, so nothing was added
+        else:
+            return
+        #mark the cell of the new last segment as occupied
+        self.grid.occupy(self.body.last().x_loc, self.body.last().y_loc)
+
     #a method that determines if the snake has crashed
     def has_crashed(self):
         #the following checks are for if the snake has crashed into the wall:
         #make sure to add an extra check to see which direction the snake is moving, otherwise the game would end prematurely if you're near a wall
         if self.body.first().x_loc - 0.5 < 0 and self.direction == 'left':
             return True
-        elif self.body.first().x_loc + 0.5 > 20 and self.direction == 'right':
+        elif self.body.first().x_loc + 0.5 > self.grid.width and self.direction == 'right':
             return True
         elif self.body.first().y_loc - 0.5 < 0 and self.direction == 'down':
             return True
-        elif self.body.first().y_loc + 0.5 > 20 and self.direction == 'up':
+        elif self.body.first().y_loc + 0.5 > self.grid.height and self.direction == 'up':
             return True
         
         #now check if it has crashed into itself
-        #step through the entire list
-        temp = self.body.header.next.next
-        while temp is not self.body.trailer:
-            #if the first node's (x,y) is the same as any other node's, we know the snake has crashed into itself
-            if self.body.first().x_loc == temp.value.x_loc and self.body.first().y_loc == temp.value.y_loc:
-                return True
-            temp = temp.next
-        #if we check everything, the snake has not crashed
-        return False
+        #the head's cell is covered by more than one segment exactly when the head ran into another segment
+        head = self.body.first()
+        return self.grid.count(head.x_loc, head.y_loc) > 1
         
 #create a class for the food object
 class Food:
@@ -320,11 +813,487 @@ class Food:
         #set the pen color to yellow and draw a square at the current position
         dudraw.set_pen_color(dudraw.RED)
         dudraw.filled_circle(self.x_loc, self.y_loc, 0.5)
-    #create a generate method that will move the food to a random location
-    def generate(self):
-        #achieve this by just changing the position to a random location on the grid
-        self.x_loc = random.randint(1, 20) - 0.5
-        self.y_loc = random.randint(1, 20) - 0.5
+    #create a generate method that will move the food to a random empty square on the grid
+    #rng is the random number generator to draw from (the game passes its own seeded one)
+    #returns False (and leaves the food where it is) when the snake covers the whole grid, meaning the player has won
+    def generate(self, grid: Grid, rng = random):
+        #achieve this by picking a square from the grid's index of empty squares, so the food never lands on the snake
+        square = grid.random_free_square(rng)
+        if square is None:
+            return False
+        self.x_loc, self.y_loc = square
+        return True
+
+#how far a GameState's head moves in x and y for each direction, and the direction codes used by GameState.to_bytes
+STATE_CHANGES = {'up': (0, 1), 'right': (1, 0), 'down': (0, -1), 'left': (-1, 0)}
+STATE_DIRECTIONS = ('up', 'right', 'down', 'left')
+#width, height, ticks, score, direction code (-1 for None), flags, food x, food y, length, then length (x, y) int16 pairs
+STATE_HEADER = struct.Struct('<HHQIbBhhI')
+STATE_GAME_OVER = 1
+STATE_WON = 2
+STATE_NO_FOOD = 4
+
+#the squares a GameState covers are kept as bits, 64 squares to an int word, in a tree of tuples with 64 children each
+#(a tree of depth 0 is a single word). Changing a bit copies only the tuples on the way down to its word, so it costs
+#the same small amount however big the world is, and states can share everything else
+def occupancy_depth(size: int):
+    depth = 0
+    while 64 ** (depth + 1) < size:
+        depth += 1
+    return depth
+
+#returns a tree for size squares with the bits of words set, where words maps the index of each word to the word
+#(words that aren't in it are 0). Only the nodes above those words are built, so it takes time proportional to len(words).
+#the root only gets as many children as the squares need (7 on the 20x20 world), so small worlds copy less per change
+def build_occupancy(words: dict, size: int):
+    depth = occupancy_depth(size)
+    level = words
+    empty = 0
+    for i in range(depth):
+        width = 64 if i < depth - 1 else -(-size // 64 ** depth)
+        parents = {}
+        for index, node in level.items():
+            parents.setdefault(index >> 6, [empty] * width)[index & 63] = node
+        level = {index: tuple(children) for index, children in parents.items()}
+        empty = (empty,) * width
+    return level.get(0, empty)
+
+#returns the bit of square in a tree of the given depth
+def occupancy_bit(tree, depth: int, square: int):
+    shift = 6 * depth
+    while shift:
+        tree = tree[square >> shift & 63]
+        shift -= 6
+    return tree >> (square & 63) & 1
+
+#returns a copy of the tree with the bit of square flipped (the tree itself is never changed)
+def occupancy_flip(tree, depth: int, square: int):
+    if depth == 0:
+        return tree ^ 1 << (square & 63)
+    index = square >> 6 * depth & 63
+    return tree[:index] + (occupancy_flip(tree[index], depth - 1, square),) + tree[index + 1:]
+
+#a compact copy of a game for lookahead search, made by SnakeGame.save_state and put back with SnakeGame.load_state
+#positions are the integer lower-left corners of squares. The body is kept in three pieces that are never changed once
+#they're made, so any number of states can share them:
+#   base: a tuple of the body's squares from the tail to the head, as it was the last time the pieces were put together.
+#         The body starts at base[start], since the squares before that have been left behind by the tail
+#   heads: a chain of (x, y, rest) links, one for each square the head has moved to since then, the newest first
+#   grown: a chain of (x, y, rest) links for the segments grown past base[start], the last one grown (the tail) first
+#which squares are covered is kept in occupied, a tree with one bit per square (row by row, like Grid, see
+#occupancy_depth). A step adds one link, moves start or drops a grown link, and flips two bits, copying at most 64
+#pointers per level of the tree for each, so copying a state plus one move depends on neither the length of the snake
+#nor (beyond a level per 64 times more squares) the size of the world. Once the tail gets to the end of base, the
+#pieces are put together into a new base, which costs one pass over the body every length steps
+class GameState:
+    __slots__ = ('width', 'height', 'ticks', 'score', 'direction', 'food', 'length', 'base', 'start', 'heads', 'grown',
+                 'occupied', 'depth', 'covered', 'overlaps', 'game_over', 'won')
+
+    def __init__(self, width: int, height: int, ticks: int, score: int, direction, food, squares, game_over: bool = False,
+                 won: bool = False):
+        """
+            parameters:
+                food: the (x, y) square of the food, or None when it isn't known (see step)
+                squares: the (x, y) squares of the body from the head back
+        """
+        self.width = width
+        self.height = height
+        self.ticks = ticks
+        self.score = score
+        self.direction = direction
+        self.food = food
+        self.game_over = game_over
+        self.won = won
+        self.length = len(squares)
+        self.base = tuple(reversed(squares))
+        self.start = 0
+        self.heads = None
+        self.grown = None
+        #the number of squares with their bit set, and the squares covered by more than one segment (once for every
+        #segment past the first), so a tail leaving one of those leaves its bit set
+        words = {}
+        overlaps = []
+        for x, y in squares:
+            if 0 <= x < width and 0 <= y < height:
+                square = y * width + x
+                word = words.get(square >> 6, 0)
+                if word >> (square & 63) & 1:
+                    overlaps.append(square)
+                words[square >> 6] = word | 1 << (square & 63)
+        self.depth = occupancy_depth(width * height)
+        self.occupied = build_occupancy(words, width * height)
+        self.covered = self.length - len(overlaps) - sum(not (0 <= x < width and 0 <= y < height) for x, y in squares)
+        self.overlaps = tuple(overlaps)
+
+    #the (x, y) squares of the body from the head back
+    def squares(self):
+        link = self.heads
+        while link is not None:
+            yield link[0], link[1]
+            link = link[2]
+        base = self.base
+        for i in range(len(base) - 1, self.start - 1, -1):
+            yield base[i]
+        grown = []
+        link = self.grown
+        while link is not None:
+            grown.append((link[0], link[1]))
+            link = link[2]
+        yield from reversed(grown)
+
+    def step(self, action = None, rng = None):
+        """
+            parameters:
+                action: the direction to turn before moving, or None to keep going straight (same as SnakeGame.step)
+                rng: the random number generator used to place new food when the snake eats. Without one the food's
+                     next square isn't known, so it becomes None and the snake can't eat again in that line of search
+            return:
+                the state one tick later, following the same rules as SnakeGame.step. The snake moves, eats, grows and
+                crashes exactly as it would in the game, but the food lands on a different square than the game would
+                put it (the game's food depends on its random number generator and the order of its grid's free list)
+        """
+        if self.game_over:
+            return self
+        direction = self.direction
+        if action in ('up', 'down') and direction in ('left', 'right') or action in ('left', 'right') and direction in ('up', 'down'):
+            direction = action
+        change_x, change_y = STATE_CHANGES[direction]
+        head = self.heads if self.heads is not None else self.base[-1]
+        x = head[0] + change_x
+        y = head[1] + change_y
+        width = self.width
+        height = self.height
+        state = GameState.__new__(GameState)
+        state.width = width
+        state.height = height
+        state.ticks = self.ticks + 1
+        state.score = self.score
+        state.direction = direction
+        state.food = self.food
+        state.length = self.length
+        state.base = self.base
+        state.heads = (x, y, self.heads)
+        state.occupied = self.occupied
+        state.depth = self.depth
+        state.covered = self.covered
+        state.overlaps = self.overlaps
+        state.won = False
+        #the tail moves out first, from the grown segments if there are any
+        if self.grown is not None:
+            tail = self.grown
+            state.grown = tail[2]
+            state.start = self.start
+        else:
+            tail = self.base[self.start]
+            state.grown = None
+            state.start = self.start + 1
+        state.uncover(tail[0], tail[1])
+        if state.start + 1 >= len(state.base):
+            #put the pieces together before the tail runs off the end of base
+            state.base = tuple(reversed(list(state.squares())))
+            state.start = 0
+            state.heads = None
+            state.grown = None
+        ate = (x, y) == state.food
+        if ate:
+            state.score += 1
+            state.grow()
+        #crash into a wall, or into any other segment
+        crashed = not (0 <= x < width and 0 <= y < height) or not state.cover(x, y)
+        size = width * height
+        if ate and state.covered == size:
+            #there is nowhere left to put the food, so the game ends with a win
+            state.game_over = state.won = True
+            return state
+        if ate:
+            if rng is None:
+                state.food = None
+            elif (size - state.covered) * 4 < size:
+                #when the board is nearly full, pick from a list of the empty squares instead of guessing
+                square = rng.choice([square for square in range(size) if not occupancy_bit(state.occupied, state.depth, square)])
+                state.food = (square % width, square // width)
+            else:
+                square = rng.randrange(size)
+                while occupancy_bit(state.occupied, state.depth, square):
+                    square = rng.randrange(size)
+                state.food = (square % width, square // width)
+        state.game_over = crashed
+        if crashed:
+            state.direction = None
+        return state
+
+    #adds a segment past the tail, away from the segment before it (the same order of checks as Snake.grow). Only used
+    #by step on the state it's making, while the state isn't shared yet
+    def grow(self):
+        grown = self.grown
+        if grown is not None:
+            last = grown
+            before = grown[2] if grown[2] is not None else self.base[self.start]
+        else:
+            last = self.base[self.start]
+            before = self.base[self.start + 1]
+        last_x, last_y = last[0], last[1]
+        change_x = before[0] - last_x
+        change_y = before[1] - last_y
+        if change_y > 0:
+            last_y -= 1
+        elif change_x < 0:
+            last_x += 1
+        elif change_y < 0:
+            last_y += 1
+        elif change_x > 0:
+            last_x -= 1
+        else:
+            return
+        self.grown = (last_x, last_y, grown)
+        self.length += 1
+        if 0 <= last_x < self.width and 0 <= last_y < self.height:
+            self.cover(last_x, last_y)
+
+    #marks a square as covered by one more segment, returning False if it already was
+    def cover(self, x: int, y: int):
+        square = y * self.width + x
+        if occupancy_bit(self.occupied, self.depth, square):
+            self.overlaps += (square,)
+            return False
+        self.occupied = occupancy_flip(self.occupied, self.depth, square)
+        self.covered += 1
+        return True
+
+    #returns whether any segment covers the square (x, y)
+    def covers(self, x: int, y: int):
+        return 0 <= x < self.width and 0 <= y < self.height and occupancy_bit(self.occupied, self.depth, y * self.width + x) == 1
+
+    #marks a square as covered by one segment less (squares outside the world aren't covered at all)
+    def uncover(self, x: int, y: int):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return
+        square = y * self.width + x
+        if square in self.overlaps:
+            overlaps = list(self.overlaps)
+            overlaps.remove(square)
+            self.overlaps = tuple(overlaps)
+        else:
+            self.occupied = occupancy_flip(self.occupied, self.depth, square)
+            self.covered -= 1
+
+    #the state packed into bytes (see STATE_HEADER), for sending it to another process or saving it
+    def to_bytes(self):
+        flags = (STATE_GAME_OVER if self.game_over else 0) | (STATE_WON if self.won else 0) | (STATE_NO_FOOD if self.food is None else 0)
+        food_x, food_y = self.food if self.food is not None else (0, 0)
+        direction = STATE_DIRECTIONS.index(self.direction) if self.direction is not None else -1
+        positions = array('h')
+        for x, y in self.squares():
+            positions.append(x)
+            positions.append(y)
+        if sys.byteorder == 'big':
+            positions.byteswap()
+        return STATE_HEADER.pack(self.width, self.height, self.ticks, self.score, direction, flags, food_x, food_y,
+                                 self.length) + positions.tobytes()
+
+#unpacks a GameState packed by GameState.to_bytes
+def game_state_from_bytes(data):
+    width, height, ticks, score, direction, flags, food_x, food_y, length = STATE_HEADER.unpack_from(data, 0)
+    positions = array('h')
+    positions.frombytes(data[STATE_HEADER.size:STATE_HEADER.size + 4 * length])
+    if sys.byteorder == 'big':
+        positions.byteswap()
+    squares = [(positions[i], positions[i + 1]) for i in range(0, len(positions), 2)]
+    return GameState(width, height, ticks, score, STATE_DIRECTIONS[direction] if direction >= 0 else None,
+                     None if flags & STATE_NO_FOOD else (food_x, food_y), squares,
+                     bool(flags & STATE_GAME_OVER), bool(flags & STATE_WON))
+
+#the headless game engine: owns the snake, the food and the score, and advances the game one tick at a time
+#it never calls dudraw, so it can be driven from tests, bots and batch jobs as fast as python allows
+class SnakeGame:
+    #body_class picks how the snake's body is stored (see Snake), and width and height set the size of the world
+    def __init__(self, seed = None, body_class = None, width: int = GRID_WIDTH, height: int = GRID_HEIGHT):
+        if width < 5 or height < 5:
+            raise ValueError("The world must be at least 5x5 squares")
+        self.body_class = body_class
+        self.width = width
+        self.height = height
+        #an optional TickProfiler (see snake_profiler.py) that step tells when each of its phases ends.
+        #unlike the recorder it carries over to new games
+        self.profiler = None
+        #an optional ReplayRecorder (see snake_replay.py) that is told about every turn and the end of the game.
+        #it records one game, so it's closed and dropped when a new game starts (see stop_recording)
+        self.recorder = None
+        self.snake = None
+        self.reset(seed)
+
+    def reset(self, seed = None):
+        """
+            parameters:
+                seed: seed for the game's random number generator (None picks a random seed)
+            return:
+                the starting state of the game (see get_state)
+            starts a brand new game with a new snake, a new food and the score set back to 0. The grid of the last game is
+            emptied and used again, so a new game on a big world doesn't have to build another one
+        """
+        #an unfinished recording keeps the turns it has so far
+        self.stop_recording()
+        #pick the seed ourselves when none is given, so the game can always be replayed from self.seed
+        if seed is None:
+            seed = random.randrange(2 ** 63)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        grid = None
+        if self.snake is not None:
+            grid = self.snake.grid
+            grid.clear()
+        self.snake = Snake(self.body_class, self.width, self.height, grid)
+        #the first food goes in the upper left (the square centered at (5.5, 16.5) on the 20x20 world)
+        self.food = Food(self.width // 4 + 0.5, self.height * 4 // 5 + 0.5)
+        self.score = 0
+        self.ticks = 0
+        self.game_over = False
+        #won is set when the snake fills the whole grid and there is nowhere left to put the food
+        self.won = False
+        return self.get_state()
+
+    #closes the ReplayRecorder (see snake_replay.py), if there is one, writing out the turns it has recorded.
+    #a recorder records one game, so this is called whenever the game is replaced by a new or different one
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def get_state(self):
+        """
+            return:
+                a tuple (head_x, head_y, food_x, food_y, direction, score) describing the game
+        """
+        head = self.snake.body.first()
+        return (head.x_loc, head.y_loc, self.food.x_loc, self.food.y_loc, self.snake.direction, self.score)
+
+    def step(self, action = None):
+        """
+            parameters:
+                action: the direction to turn ('up', 'down', 'left' or 'right') before moving,
+                        or None to keep going straight. Turns back onto the snake are ignored
+            return:
+                a tuple (state, reward, done). reward is 1 when the snake eats, -1 when it crashes and 0 otherwise
+            advances the game by one tick. Once the game is over, step does nothing until reset is called.
+            The action is applied before the snake moves, and a turn queued with Snake.queue_turn is applied as it
+            moves, so a queued turn (checked against the direction after the action) wins when both are given
+        """
+        if self.game_over:
+            return self.get_state(), 0, True
+        #only look at the profiler once per tick when it's switched off
+        profiler = self.profiler if self.profiler is not None and self.profiler.enabled else None
+        direction = self.snake.direction
+        if action is not None:
+            self.snake.turn(action)
+        #move the snake, then check if it ate the food and if it crashed (same order as the original loop)
+        self.snake.move()
+        #the direction can change from the action or from a queued turn, either way it's what a replay needs to know
+        if self.recorder is not None and self.snake.direction != direction:
+            self.recorder.record_turn(self.ticks, self.snake.direction)
+        self.ticks += 1
+        reward = 0
+        if profiler is not None:
+            profiler.lap('move')
+        if self.snake.has_found_food(self.food):
+            #if so, the snake grows and the food moves location. Score is also incremented
+            self.snake.grow()
+            self.score += 1
+            reward = 1
+            if profiler is not None:
+                profiler.lap('food')
+            generated = self.food.generate(self.snake.grid, self.rng)
+            if profiler is not None:
+                profiler.lap('generate')
+            if not generated:
+                #there are no empty squares left, so the game ends with a win
+                self.won = True
+                self.game_over = True
+                if self.recorder is not None:
+                    self.recorder.record_end(self)
+                return self.get_state(), reward, True
+        elif profiler is not None:
+            profiler.lap('food')
+        if self.snake.has_crashed():
+            #if so, stop the snake by making the direction None. Change game_over to True
+            self.snake.direction = None
+            self.game_over = True
+            reward = -1
+            if self.recorder is not None:
+                self.recorder.record_end(self)
+        if profiler is not None:
+            profiler.lap('crash')
+        return self.get_state(), reward, self.game_over
+
+    def snapshot(self):
+        """
+            return:
+                a copy of everything needed to put the game back exactly the way it is now with restore(),
+                including the random number generator and the order of the grid's free list, so the game continues
+                exactly the same way afterwards. The order of the free list decides where the food goes next and
+                can't be worked out from the snake, so it is copied along with where each square is in it (8 bytes
+                per square of the world). The grid's counts are rebuilt from the body instead
+        """
+        grid = self.snake.grid
+        positions = array('d')
+        for segment in self.snake.body:
+            positions.append(segment.x_loc)
+            positions.append(segment.y_loc)
+        return (self.seed, self.rng.getstate(), self.ticks, self.score, self.game_over, self.won, self.snake.direction,
+                self.food.x_loc, self.food.y_loc, positions, array('i', grid.free), array('i', grid.free_pos))
+
+    #puts the game back the way it was when snapshot() returned the given snapshot
+    def restore(self, snapshot):
+        (self.seed, rng_state, self.ticks, self.score, self.game_over, self.won, direction,
+         food_x, food_y, positions, free, free_pos) = snapshot
+        self.rng.setstate(rng_state)
+        #reuse the grid instead of building a new one, which takes a while on big worlds
+        grid = self.snake.grid
+        grid.cells = bytearray(self.width * self.height)
+        grid.free = array('i', free)
+        grid.free_pos = array('i', free_pos)
+        self.snake = Snake(self.body_class, self.width, self.height, grid, [], direction)
+        for i in range(0, len(positions), 2):
+            self.snake.body.add_last(SnakeSegment(positions[i], positions[i + 1]))
+            if grid.in_bounds(positions[i], positions[i + 1]):
+                grid.cells[int(positions[i + 1]) * self.width + int(positions[i])] += 1
+        self.food = Food(food_x, food_y)
+        self.stop_recording()
+
+    def save_state(self):
+        """
+            return:
+                a GameState copy of the snake, the food and the score for lookahead search, taking time proportional
+                to the length of the snake. Unlike snapshot() it leaves out the random number generator and the grid,
+                so a game put back with load_state() places its next food differently than it would have
+        """
+        squares = [(int(segment.x_loc - 0.5), int(segment.y_loc - 0.5)) for segment in self.snake.body]
+        return GameState(self.width, self.height, self.ticks, self.score, self.snake.direction,
+                         (int(self.food.x_loc - 0.5), int(self.food.y_loc - 0.5)), squares, self.game_over, self.won)
+
+    #puts the snake, food and score back the way they are in a GameState, in time proportional to the length of the snake
+    #(the grid is updated square by square instead of being copied). A state with no food gets new food from the game
+    def load_state(self, state: GameState):
+        if state.width != self.width or state.height != self.height:
+            raise ValueError(f"A {state.width}x{state.height} state can't be loaded into a {self.width}x{self.height} game")
+        grid = self.snake.grid
+        for segment in self.snake.body:
+            grid.vacate(segment.x_loc, segment.y_loc)
+        body = DoublyLinkedList() if self.body_class is None else self.body_class()
+        for x, y in state.squares():
+            body.add_last(SnakeSegment(x + 0.5, y + 0.5))
+            grid.occupy(x + 0.5, y + 0.5)
+        self.snake.body = body
+        self.snake.direction = state.direction
+        self.snake.turns.clear()
+        self.ticks = state.ticks
+        self.score = state.score
+        self.game_over = state.game_over
+        self.won = state.won
+        if state.food is not None:
+            self.food = Food(state.food[0] + 0.5, state.food[1] + 0.5)
+        else:
+            self.food.generate(grid, self.rng)
+        self.stop_recording()
 
 #provided test code to test the DoublyLinkedList class
 def dll_tester():
@@ -374,80 +1343,745 @@ def dll_tester():
     assert test_list.get(5) == 6, 'get(1) should return the element at index 1'
     assert test_list.get(9) == 10, 'get(9) should return the element at last index'
 
+    #test indexing from either end, with and without the finger
+    assert [test_list.get(i) for i in range(10)] == list(range(1, 11)), 'get should work walking forwards'
+    assert [test_list.get(i) for i in range(9, -1, -1)] == list(range(10, 0, -1)), 'get should work walking backwards'
+    assert [test_list.get(i) for i in (7, 2, 9, 0, 5, 4)] == [8, 3, 10, 1, 6, 5], 'get should work jumping around'
+    assert test_list[-1] == 10 and test_list[-10] == 1, 'negative indexes should count from the end'
+    try:
+        test_list.get(10)
+        assert False, 'get(10) should raise an IndexError'
+    except IndexError:
+        pass
+
+    #test the iteration protocol
+    assert len(test_list) == 10, 'len needs adjustment!'
+    assert list(test_list) == list(range(1, 11)), 'iteration needs adjustment!'
+    assert list(reversed(test_list)) == list(range(10, 0, -1)), 'reversed iteration needs adjustment!'
+    assert list(test_list[2:5]) == [3, 4, 5], 'slicing needs adjustment!'
+    assert list(test_list[::-3]) == [10, 7, 4, 1], 'slicing with a step needs adjustment!'
+
+    #test extend and splice
+    other = DoublyLinkedList()
+    other.extend([20, 21, 22])
+    test_list.splice(other, 1)
+    assert list(test_list) == [1, 20, 21, 22] + list(range(2, 11)), 'splice needs adjustment!'
+    assert other.get_size() == 0 and list(other) == [], 'splice should leave the other list empty'
+    assert test_list.get_size() == 13 and test_list.last() == 10, 'splice needs adjustment!'
+    test_list.extend(test_list)
+    assert test_list.get_size() == 26 and test_list.get(13) == 1, 'extend needs adjustment!'
+
+    print('All tests passed!')
+
+#test code for the snake's body, run against every body class (DoublyLinkedList and SegmentRingBuffer)
+def body_tester(body_class = DoublyLinkedList):
+    body = body_class()
+    assert body.get_size() == 0 and body.is_empty(), 'body should be empty to start!'
+
+    #build the body 0.5, 1.5, ..., 99.5 from both ends, enough to make the ring buffer grow a few times
+    for i in range(50, 100):
+        body.add_last(SnakeSegment(i + 0.5, -i - 0.5))
+    for i in range(49, -1, -1):
+        body.add_first(SnakeSegment(i + 0.5, -i - 0.5))
+    assert body.get_size() == 100, 'add_first/add_last needs adjustment!'
+    assert body.first().x_loc == 0.5 and body.last().x_loc == 99.5, 'first/last needs adjustment!'
+    for i in range(100):
+        assert body.get(i).x_loc == i + 0.5 and body.get(i).y_loc == -i - 0.5, 'get needs adjustment!'
+    assert [segment.x_loc for segment in body] == [i + 0.5 for i in range(100)], 'iteration needs adjustment!'
+    assert body[-1].x_loc == 99.5 and len(body) == 100, 'indexing needs adjustment!'
+    part = body[10:13]
+    assert isinstance(part, body_class) and [(s.x_loc, s.y_loc) for s in part] == [(10.5, -10.5), (11.5, -11.5), (12.5, -12.5)], \
+        'slicing needs adjustment!'
+    assert [segment.x_loc for segment in body[::-30]] == [99.5, 69.5, 39.5, 9.5], 'slicing with a step needs adjustment!'
+
+    #moving the last segment to the front keeps the size and rotates the order
+    segment = body.move_last_to_first()
+    segment.x_loc = -1.5
+    assert body.get_size() == 100 and body.first().x_loc == -1.5, 'move_last_to_first needs adjustment!'
+    assert body.get(1).x_loc == 0.5 and body.last().x_loc == 98.5, 'move_last_to_first needs adjustment!'
+
+    #removing from both ends returns the removed positions
+    assert body.remove_first().x_loc == -1.5, 'remove_first needs adjustment!'
+    assert body.remove_last().x_loc == 98.5, 'remove_last needs adjustment!'
+    while not body.is_empty():
+        body.remove_last()
+    assert body.get_size() == 0, 'body should be empty after removing all segments'
+
+    #a snake should behave the same whichever body it uses
+    linked = SnakeGame(7)
+    other = SnakeGame(7, body_class)
+    rng = random.Random(7)
+    for tick in range(5000):
+        action = rng.choice(('up', 'down', 'left', 'right', None, None, None))
+        assert linked.step(action) == other.step(action), 'games with different bodies should match!'
+        if linked.game_over:
+            linked.reset(tick)
+            other.reset(tick)
+
+    print('All tests passed!')
+
+#test code that plays random games and checks the occupancy grid crash check against a linear scan of the body
+def snake_tester(body_class = DoublyLinkedList):
+    #the original crash check: compare the head with every other segment of the body
+    def crashed_into_itself(snake):
+        segments = list(snake.body)
+        for segment in segments[1:]:
+            if segments[0].x_loc == segment.x_loc and segments[0].y_loc == segment.y_loc:
+                return True
+        return False
+
+    rng = random.Random(1353)
+    crashes = 0
+    for game_number in range(200):
+        snake = Snake(body_class)
+        for tick in range(500):
+            snake.turn(rng.choice(('up', 'down', 'left', 'right')))
+            snake.move()
+            #grow often so the snake gets long enough to run into itself
+            if rng.random() < 0.2:
+                snake.grow()
+            head = snake.body.first()
+            if not snake.grid.in_bounds(head.x_loc, head.y_loc):
+                assert snake.has_crashed(), 'leaving the world should be a crash!'
+                break
+            assert snake.has_crashed() == crashed_into_itself(snake), 'occupancy grid disagrees with the linear scan!'
+            if snake.has_crashed():
+                crashes += 1
+                break
+        #every segment inside the world should be counted exactly once in the grid
+        expected = bytearray(snake.grid.width * snake.grid.height)
+        for segment in snake.body:
+            if snake.grid.in_bounds(segment.x_loc, segment.y_loc):
+                expected[int(segment.y_loc) * snake.grid.width + int(segment.x_loc)] += 1
+        assert snake.grid.cells == expected, 'occupancy grid is out of sync with the body!'
+        #the free list should hold exactly the empty squares, and free_pos should point back into it
+        assert sorted(snake.grid.free) == [i for i in range(len(expected)) if expected[i] == 0], 'free list is out of sync!'
+        for position in range(len(snake.grid.free)):
+            assert snake.grid.free_pos[snake.grid.free[position]] == position, 'free_pos is out of sync!'
+    assert crashes > 0, 'some random games should end with the snake crashing into itself'
+
+    #food should only ever land on empty squares, even when the grid is nearly full
+    grid = Grid()
+    for y in range(grid.height):
+        for x in range(grid.width):
+            if (x, y) not in ((3, 4), (17, 11)):
+                grid.occupy(x + 0.5, y + 0.5)
+    food = Food(0.5, 0.5)
+    seen = set()
+    for i in range(100):
+        assert food.generate(grid, rng), 'there is still room for the food!'
+        seen.add((food.x_loc, food.y_loc))
+    assert seen == {(3.5, 4.5), (17.5, 11.5)}, 'food should be spread over the empty squares only'
+    grid.occupy(3.5, 4.5)
+    grid.occupy(17.5, 11.5)
+    assert not food.generate(grid, rng), 'a full grid has nowhere to put the food'
+
+    #two quick turns before a move should be applied on two consecutive moves
+    snake = Snake()
+    assert snake.queue_turn('left') and snake.queue_turn('down'), 'both turns should be queued'
+    assert not snake.queue_turn('up'), 'reversing the last queued turn should be rejected'
+    assert not snake.queue_turn('down'), 'repeating the last queued turn should be rejected'
+    snake.move()
+    assert snake.direction == 'left' and snake.body.first().x_loc == 11.5, 'the first move should apply the first turn'
+    snake.move()
+    assert snake.direction == 'down' and snake.body.first().y_loc == 7.5, 'the second move should apply the second turn'
+    snake.move()
+    assert snake.direction == 'down' and snake.turns.applied == 2, 'with no turns queued the snake keeps going'
+    assert snake.turns.max_latency >= snake.turns.mean_latency() >= 0, 'latency should be measured'
+    assert snake.queue_turn('left') and snake.queue_turn('up') and snake.queue_turn('right'), 'the queue holds 3 turns'
+    assert not snake.queue_turn('down'), 'a full queue should reject more turns'
+
     print('All tests passed!')
 
-#main animation loop
-dudraw.set_canvas_size(600, 600)
-#create a snake object and a food object
-snake = Snake()
-food = Food(5.5, 16.5)
-limit = 1 #number of frames to allow to pass before snake moves
-timer = 0  #a timer to keep track of number of frames that passed
-key = '' #create an empty key variable for our animation loop condition
-score = 0 #create a score variable to keep track of the user's score
-game_over = False #create a game over variable, intitialized to False, so we know when the game is over
-#set the x and y scale so our world is a 20x20 grid
-dudraw.set_x_scale(0, 20)
-dudraw.set_y_scale(0, 20)
-#continue while q has not been pressed:
-while key != 'q':
-    timer += 1
-    #process keyboard press here
-    if dudraw.has_next_key_typed():
-        #get the key
-        key = dudraw.next_key_typed()
-        #add an extra check that only allows the snake to be moved if the game is not over.
-        #this prevents the user from being able to continue after crashing
-        if not game_over:
-            #process w by changing direction to up. Only process when the snake is moving left/right to prevent a game over when the user accidentally turns back on theirself
-            if key == 'w' and (snake.direction == 'left' or snake.direction == 'right'):
-                snake.direction = "up"
-            #process a by changing direction to left. Only process when the snake is moving up/down to prevent a game over when the user accidentally turns back on theirself
-            if key == 'a' and (snake.direction == 'up' or snake.direction == 'down'):
-                snake.direction = "left"
-            #process s by changing direction to down. Only process when the snake is moving left/right to prevent a game over when the user accidentally turns back on theirself
-            if key == 's' and (snake.direction == 'left' or snake.direction == 'right'):
-                snake.direction = "down"
-            #process d by changing direction to right. Only process when the snake is moving up/down to prevent a game over when the user accidentally turns back on theirself
-            if key == 'd' and (snake.direction == 'up' or snake.direction =='down'):
-                snake.direction = "right"
-    #add an extra condition so that when r is pressed, the game restarts
-    if key == 'r':
-        #accomplish this by making a new snake, a new food, resetting the score, and making sure game_over is False
-        snake = Snake()
-        food = Food(5.5, 16.5)
-        score = 0
-        game_over = False      
-    #update the world according to the timer limit to prevent the snake from being too fast   
-    if timer == limit:
-        #reset the timer
-        timer = 0
-        #clear the screen
+#test code for worlds of other sizes
+def grid_size_tester():
+    #the default world starts exactly like the original 20x20 game
+    game = SnakeGame(0)
+    assert [(segment.x_loc, segment.y_loc) for segment in game.snake.body] == [(12.5, 8.5), (12.5, 7.5), (12.5, 6.5)], 'the 20x20 start changed!'
+    assert (game.food.x_loc, game.food.y_loc) == (5.5, 16.5), 'the 20x20 food start changed!'
+    #a narrow world: the snake crashes into the right wall after leaving the last column
+    game = SnakeGame(0, width = 7, height = 30)
+    game.step('right')
+    assert not game.game_over and game.get_state()[0] == 5.5, 'the snake should still be inside a 7 wide world'
+    game.step()
+    assert not game.game_over and game.get_state()[0] == 6.5, 'x = 6.5 is the last column of a 7 wide world'
+    game.step()
+    assert game.game_over, 'leaving a 7 wide world should be a crash'
+    #a huge world plays in constant time per tick, with food placed anywhere on it
+    game = SnakeGame(0, SegmentRingBuffer, 4096, 4096)
+    assert game.snake.grid.free_count() == 4096 * 4096 - 3, 'every other square should be free'
+    for tick in range(1000):
+        game.step(('left', 'up', 'right', 'up')[tick // 10 % 4] if tick % 10 == 0 else None)
+    assert not game.game_over and game.ticks == 1000, 'the snake has plenty of room'
+    assert game.snake.grid.count(*game.get_state()[:2]) == 1, 'the head should be on the grid'
+    for i in range(100):
+        assert game.food.generate(game.snake.grid, game.rng), 'there is room for the food'
+        assert game.snake.grid.count(game.food.x_loc, game.food.y_loc) == 0, 'food should be on an empty square'
+    #a reset empties the same grid, which then plays out exactly like a new game with the same seed
+    grid = game.snake.grid
+    game.reset(5)
+    fresh = SnakeGame(5, SegmentRingBuffer, 4096, 4096)
+    assert game.snake.grid is grid and grid.free == fresh.snake.grid.free and grid.cells == fresh.snake.grid.cells, \
+        'reset should leave the grid like a new one'
+    for tick in range(200):
+        action = ('left', 'up', 'right', 'up')[tick // 10 % 4] if tick % 10 == 0 else None
+        assert game.step(action) == fresh.step(action), 'a reset game should match a new one'
+
+    print('All tests passed!')
+
+#benchmark that checks moving the snake doesn't allocate memory once it is warmed up
+def move_allocation_tester(ticks: int = 100000):
+    import tracemalloc
+    #build a long snake that circles around the world forever without crashing
+    snake = Snake()
+    for i in range(25):
+        snake.grow()
+    turns = ('left', 'down', 'right', 'up')
+    def run(count):
+        for tick in range(count):
+            if tick % 8 == 0:
+                snake.turn(turns[tick // 8 % 4])
+            snake.move()
+    #warm up first, so any one-time allocations happen before we start measuring
+    run(100)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    run(ticks)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    #time it again without tracing to report the real speed
+    start = time.perf_counter()
+    run(ticks)
+    elapsed = time.perf_counter() - start
+    assert not snake.has_crashed(), 'the benchmark snake should never crash'
+    assert after - before == 0, f'moving allocated {after - before} bytes over {ticks} ticks'
+    #the peak only ever sees the few floats and ints of the move in progress, so it doesn't grow with the number of moves
+    assert peak - before <= 1024, f'moving peaked at {peak - before} bytes over {ticks} ticks, {(peak - before) / ticks:.3f} bytes per move'
+    print(f'{ticks} moves of a {snake.body.get_size()} segment snake: {ticks / elapsed:.0f} moves/sec, '
+          f'{after - before} bytes retained, {peak - before} bytes peak')
+
+#test code that steps GameStates alongside real games and checks they agree, share their pieces and pack into bytes
+def game_state_tester(games: int = 30):
+    rng = random.Random(1353)
+    for seed in range(games):
+        game = SnakeGame(seed, width = 12, height = 10)
+        state = game.save_state()
+        while not game.game_over:
+            action = rng.choice(('up', 'down', 'left', 'right')) if rng.random() < 0.2 else None
+            game.step(action)
+            previous = state
+            state = state.step(action)
+            assert list(state.squares()) == [(int(s.x_loc - 0.5), int(s.y_loc - 0.5)) for s in game.snake.body], 'state body disagrees!'
+            assert (state.score, state.ticks, state.direction, state.game_over, state.won) == \
+                   (game.score, game.ticks, game.snake.direction, game.game_over, game.won), 'state disagrees with the game!'
+            if state.base is previous.base:
+                assert state.heads[2] is previous.heads, 'a step should share the previous body'
+            assert state.covered == 12 * 10 - game.snake.grid.cells.count(0) and \
+                   all(state.covers(x, y) == (game.snake.grid.cells[y * 12 + x] > 0) for y in range(10) for x in range(12)), \
+                   'the covered squares disagree!'
+            assert game_state_from_bytes(state.to_bytes()).to_bytes() == state.to_bytes(), 'bytes should round trip'
+            if state.score != previous.score and not state.game_over:
+                #the state's food went somewhere else, so move it to the game's and carry on with the grown body
+                state.food = (int(game.food.x_loc - 0.5), int(game.food.y_loc - 0.5))
+    #a game loaded from a state carries on from it, with the grid matching the snake
+    game = SnakeGame(7, width = 12, height = 10)
+    for action in ('left', 'left', 'up', 'up'):
+        game.step(action)
+    saved = game.save_state()
+    other = SnakeGame(8, width = 12, height = 10)
+    other.load_state(saved)
+    assert other.get_state() == game.get_state(), 'load_state should put the game back'
+    cells = bytearray(12 * 10)
+    for segment in other.snake.body:
+        if other.snake.grid.in_bounds(segment.x_loc, segment.y_loc):
+            cells[int(segment.y_loc) * 12 + int(segment.x_loc)] += 1
+    assert other.snake.grid.cells == cells and len(other.snake.grid.free) == cells.count(0), 'the grid should match the body'
+    #a search can look ahead thousands of times from one state without touching the game
+    for i in range(1000):
+        ahead = saved
+        for action in ('up', 'left', 'down', 'right'):
+            ahead = ahead.step(action, rng)
+    assert game.save_state().to_bytes() == saved.to_bytes(), 'looking ahead should not change the saved state'
+    #a long line of steps (going round in a small square) drops the links the tail left behind
+    ahead = saved
+    for i in range(1000):
+        for action in ('right', 'down', 'left', 'up'):
+            ahead = ahead.step(action)
+    assert not ahead.game_over and len(ahead.base) == ahead.length and ahead.start < ahead.length, 'old squares should be dropped'
+    assert next(ahead.squares()) == next(saved.squares()), 'going round the square should end where it started'
+    #filling the last empty square wins, even though the new segment grows off the board
+    squares = [(x if y % 2 == 0 else 4 - x, y) for y in range(5) for x in range(5)][:24]
+    state = GameState(5, 5, 0, 23, 'right', (4, 4), squares[::-1])
+    game = SnakeGame(1, width = 5, height = 5)
+    game.load_state(state)
+    game.step()
+    state = state.step()
+    assert state.won and state.game_over and game.won, 'covering the board should win'
+    assert list(state.squares()) == [(int(s.x_loc - 0.5), int(s.y_loc - 0.5)) for s in game.snake.body], 'state body disagrees!'
+    #on a 4096x4096 world a state and each of its one move children only keep a few KB, not a bit for every square
+    import tracemalloc
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    state = GameState(4096, 4096, 0, 0, 'up', None, [(2048, 2048 - i) for i in range(3)])
+    made = tracemalloc.get_traced_memory()[0] - before
+    children = [state.step(action) for action in ('up', 'left', 'right') * 100]
+    kept = tracemalloc.get_traced_memory()[0] - before - made
+    tracemalloc.stop()
+    assert made < 16384 and kept < 8192 * len(children), f'a state took {made} bytes and its children {kept} bytes'
+    assert children[1].covers(2047, 2048) and not children[1].covers(2048, 2046) and not state.covers(2047, 2048), \
+        'children should have their own squares without changing the state they came from'
+
+    print('All tests passed!')
+
+#runs every test in this file and in the other snake_*.py modules, returning normally only if they all pass
+def run_tests():
+    dll_tester()
+    for body_class in (DoublyLinkedList, SegmentRingBuffer):
+        body_tester(body_class)
+        snake_tester(body_class)
+    grid_size_tester()
+    timestep_tester()
+    renderer_tester()
+    move_allocation_tester()
+    game_state_tester()
+    #then the tests of the other snake_*.py modules, which all build on this one
+    from snake_arena import arena_tester
+    from snake_autopilot import autopilot_tester
+    from snake_batch import batch_tester, np
+    from snake_profiler import profiler_tester
+    from snake_replay import replay_tester
+    from snake_tournament import tournament_tester
+    if np is not None:
+        batch_tester()
+    else:
+        print('NumPy is not installed, skipping batch_tester')
+    replay_tester()
+    autopilot_tester()
+    tournament_tester()
+    profiler_tester()
+    arena_tester()
+
+#draws the score as text in the top left
+def draw_score(game: SnakeGame):
+    dudraw.set_pen_color(dudraw.WHITE)
+    dudraw.set_font_size(15)
+    dudraw.text(game.width * 0.075, game.height * 0.95, f"Score: {game.score}")
+
+#displays a game over message in the middle of the screen
+def draw_game_over(game: SnakeGame):
+    dudraw.set_pen_color(dudraw.RED)
+    dudraw.set_font_size(20)
+    dudraw.text(game.width / 2, game.height / 2, "YOU WIN" if game.won else "GAME OVER")
+
+#draws the score, the game over message (if needed), the snake and the food
+def draw_game(game: SnakeGame):
+    #add Text to the top left to display the score
+    draw_score(game)
+    #if the game is over, display a game over message in the middle of the screen
+    if game.game_over:
+        draw_game_over(game)
+    #draw the updated version of the snake and the food
+    game.snake.draw()
+    game.food.draw()
+
+#returns the squares (as (x, y) pairs of lower-left corners) that the score text in the top left can cover
+#on the 20x20 world that is x from 0 to 2 and y from 18 to 19
+def score_squares(width: int, height: int):
+    return [(x, y) for y in range(int(height * 0.93), math.ceil(height * 0.97)) for x in range(math.ceil(width * 0.14))]
+
+#returns the squares that the game over message in the middle can cover (x from 8 to 11 and y from 9 to 10 on 20x20)
+def game_over_squares(width: int, height: int):
+    return [(x, y) for y in range(int(height * 0.47), math.ceil(height * 0.53)) for x in range(int(width * 0.4), math.ceil(width * 0.6))]
+
+#how far the head moves in x and y for each direction, used to find the square the tongue is drawn over
+DIRECTION_CHANGES = {'up': (0, 1), 'down': (0, -1), 'left': (-1, 0), 'right': (1, 0)}
+
+#draws a game frame by frame. In incremental mode it keeps the previous frame on the canvas and only repaints
+#the squares that changed since then: the new head and its face, the old head, the square the old tongue covered,
+#the squares the tail left and the food and score when they change. That is a constant number of draw calls per tick
+#no matter how long the snake is, and none at all for a frame where nothing changed. The first frame of every game
+#(and every frame when incremental is False) is a full clear-and-redraw
+class Renderer:
+    def __init__(self, incremental: bool = True):
+        self.incremental = incremental
+        #what was on the canvas after the last frame
+        self.snake = None
+        self.head = None
+        self.food = None
+        self.score = None
+        self.game_over = False
+        self.score_squares = []
+        self.game_over_squares = []
+
+    #draws the current state of the game
+    def draw(self, game: SnakeGame):
+        #a new snake means the game was reset (or this is the first frame), so the old frame is no use
+        if not self.incremental or game.snake is not self.snake:
+            self.full_redraw(game)
+            return
+        grid = game.snake.grid
+        #repaint every square that became covered or empty since the last frame
+        dirty = set(grid.changed)
+        grid.changed.clear()
+        #if the head moved or turned, the old head loses its face, so repaint it and the square its tongue was drawn over
+        head = game.snake.body.first()
+        moved = (head.x_loc, head.y_loc, game.snake.direction) != self.head
+        if moved:
+            dirty.update(self.face_squares(grid, *self.head))
+        #if the food moved, repaint the square it left and the square it moved to
+        food = (game.food.x_loc, game.food.y_loc)
+        if food != self.food:
+            dirty.add(int(self.food[1]) * grid.width + int(self.food[0]))
+            dirty.add(int(food[1]) * grid.width + int(food[0]))
+        for index in dirty:
+            if grid.in_bounds(index % grid.width + 0.5, index // grid.width + 0.5):
+                self.paint_square(game, index % grid.width, index // grid.width)
+        #the score text is drawn over the squares in the top left, so redraw it if it changed or if one of those squares did
+        if game.score != self.score or any(y * grid.width + x in dirty for x, y in self.score_squares):
+            self.paint_score(game)
+        #draw the face on the new head, or again on the same head if a repainted square covered part of it
+        if grid.in_bounds(head.x_loc, head.y_loc) and (moved or not dirty.isdisjoint(
+                self.face_squares(grid, head.x_loc, head.y_loc, game.snake.direction))):
+            game.snake.draw_face(head.x_loc, head.y_loc)
+        #the game over message goes on top, and like the score it's drawn again if a square under it was repainted
+        if game.game_over and (not self.game_over or any(y * grid.width + x in dirty for x, y in self.game_over_squares)):
+            draw_game_over(game)
+        self.remember(game)
+
+    #the indexes of the squares the face of a head at (x, y) going in direction is drawn on: the head and the square
+    #its tongue sticks into
+    def face_squares(self, grid: Grid, x, y, direction):
+        squares = []
+        if grid.in_bounds(x, y):
+            squares.append(int(y) * grid.width + int(x))
+        if direction in DIRECTION_CHANGES:
+            change_x, change_y = DIRECTION_CHANGES[direction]
+            if grid.in_bounds(x + change_x, y + change_y):
+                squares.append(int(y + change_y) * grid.width + int(x + change_x))
+        return squares
+
+    #clears the canvas, draws the whole game and starts keeping track of the squares that change
+    def full_redraw(self, game: SnakeGame):
         dudraw.clear(dudraw.BLACK)
-        #add Text to the top lef to display the score
-        dudraw.set_pen_color(dudraw.WHITE)
-        dudraw.set_font_size(15)
-        dudraw.text(1.5, 19, f"Score: {score}")
-        #draw and move the snake
-        snake.move()
-        #check to see if snake ate the fruit
-        if snake.has_found_food(food):
-            #if so, the snake grows and the food moves location. Score is also incremented
-            snake.grow()
-            food.generate()
-            score += 1
-        #check if the snake has crashed
-        if snake.has_crashed():
-            #if so, stop the snake by making the direction None. Change game_over to True
-            snake.direction = None
-            game_over = True
-        #if the game is over, display a game over message in the middle of the screen
-        if game_over:
-            dudraw.set_pen_color(dudraw.RED)
-            dudraw.set_font_size(20)
-            dudraw.text(10, 10, "GAME OVER")
-        #draw the updated version of the snake and the food
-        snake.draw()
-        food.draw()
-    #show the canvas
-    dudraw.show(100)
\ No newline at end of file
+        draw_game(game)
+        self.score_squares = score_squares(game.width, game.height)
+        self.game_over_squares = game_over_squares(game.width, game.height)
+        if self.incremental:
+            game.snake.grid.changed = []
+        self.remember(game)
+
+    #saves what is on the canvas now, so the next frame can tell what changed
+    def remember(self, game: SnakeGame):
+        head = game.snake.body.first()
+        self.snake = game.snake
+        self.head = (head.x_loc, head.y_loc, game.snake.direction)
+        self.food = (game.food.x_loc, game.food.y_loc)
+        self.score = game.score
+        self.game_over = game.game_over
+
+    #repaints the square whose lower-left corner is (x, y) with whatever is in it now: a snake segment, the food or nothing
+    def paint_square(self, game: SnakeGame, x, y):
+        if game.snake.grid.cells[y * game.snake.grid.width + x] > 0:
+            dudraw.set_pen_color(SEGMENT_COLOR)
+            dudraw.filled_square(x + 0.5, y + 0.5, 0.5)
+            return
+        dudraw.set_pen_color(dudraw.BLACK)
+        dudraw.filled_square(x + 0.5, y + 0.5, 0.5)
+        if game.food.x_loc == x + 0.5 and game.food.y_loc == y + 0.5:
+            game.food.draw()
+
+    #redraws the score the same way a full frame does: background first, then the text, then the snake and food on top
+    def paint_score(self, game: SnakeGame):
+        dudraw.set_pen_color(dudraw.BLACK)
+        for x, y in self.score_squares:
+            dudraw.filled_square(x + 0.5, y + 0.5, 0.5)
+        draw_score(game)
+        for x, y in self.score_squares:
+            if game.snake.grid.cells[y * game.snake.grid.width + x] > 0 or (game.food.x_loc, game.food.y_loc) == (x + 0.5, y + 0.5):
+                self.paint_square(game, x, y)
+
+#worlds wider or taller than this many squares are drawn with a PixelRenderer, since their squares are only a few pixels
+PIXEL_RENDER_SIZE = 100
+
+#draws big worlds by keeping an RGB pixel buffer with one pixel per square and stretching it over the whole canvas
+#in a single blit, instead of issuing one filled_square per segment. Like the incremental Renderer, only the squares
+#that changed since the last frame are written into the buffer, so the cost per tick doesn't depend on the snake's length
+class PixelRenderer:
+    def __init__(self):
+        #the snake and food that the buffer shows
+        self.snake = None
+        self.food = None
+        self.pixels = None
+
+    #sets the pixel of the square at index (row by row from the bottom, like Grid) to the color (r, g, b)
+    def set_pixel(self, grid: Grid, index, color):
+        #pixel rows go from the top of the image down, but grid rows go from the bottom up
+        offset = ((grid.height - 1 - index // grid.width) * grid.width + index % grid.width) * 3
+        self.pixels[offset:offset + 3] = color
+
+    #writes whatever is in the square at index now into the buffer: a snake segment or nothing
+    def paint_square(self, grid: Grid, index):
+        self.set_pixel(grid, index, (0, 255, 0) if grid.cells[index] > 0 else (0, 0, 0))
+
+    #draws the current state of the game
+    def draw(self, game: SnakeGame):
+        import pygame
+        grid = game.snake.grid
+        if game.snake is not self.snake:
+            #a new game: start from a black buffer and paint the (short) starting snake
+            self.pixels = bytearray(grid.width * grid.height * 3)
+            for segment in game.snake.body:
+                if grid.in_bounds(segment.x_loc, segment.y_loc):
+                    self.paint_square(grid, int(segment.y_loc) * grid.width + int(segment.x_loc))
+            grid.changed = []
+            self.snake = game.snake
+        else:
+            for index in set(grid.changed):
+                self.paint_square(grid, index)
+            grid.changed.clear()
+            #the square the food left shows whatever is there now
+            if self.food != (game.food.x_loc, game.food.y_loc):
+                self.paint_square(grid, int(self.food[1]) * grid.width + int(self.food[0]))
+        self.food = (game.food.x_loc, game.food.y_loc)
+        self.set_pixel(grid, int(game.food.y_loc) * grid.width + int(game.food.x_loc), (255, 0, 0))
+        #stretch the buffer over dudraw's canvas, then draw the text on top of it
+        image = pygame.image.frombuffer(self.pixels, (grid.width, grid.height), 'RGB')
+        canvas = dudraw.dudraw._surface
+        canvas.blit(pygame.transform.scale(image, canvas.get_size()), (0, 0))
+        draw_score(game)
+        if game.game_over:
+            draw_game_over(game)
+
+#a fixed-timestep scheduler that decides when the game should tick and when it should draw, based on a monotonic clock
+#ticks happen at tick_rate per second no matter how long drawing takes: the time since the last call is added to an
+#accumulator and one tick is run for every tick length in it. If drawing falls so far behind that more than
+#max_ticks_per_frame ticks are due at once, the extra ticks are skipped (and counted) instead of spiraling further behind.
+#frames are drawn at their own render_rate
+class FixedTimestep:
+    def __init__(self, tick_rate: float = 10.0, render_rate: float = 30.0, max_ticks_per_frame: int = 5, clock = time.monotonic):
+        self.tick_length = 1.0 / tick_rate
+        self.render_length = 1.0 / render_rate
+        self.max_ticks_per_frame = max_ticks_per_frame
+        self.clock = clock
+        self.accumulator = 0.0
+        self.last_time = None
+        self.next_render = None
+        #the number of ticks dropped because the loop fell too far behind
+        self.skipped_ticks = 0
+
+    #method that returns how many ticks are due since the last call
+    def ticks_due(self):
+        now = self.clock()
+        if self.last_time is None:
+            self.last_time = now
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        ticks = int(self.accumulator / self.tick_length)
+        if ticks > self.max_ticks_per_frame:
+            #too far behind to catch up: run as many ticks as allowed and forget the rest
+            self.skipped_ticks += ticks - self.max_ticks_per_frame
+            self.accumulator -= ticks * self.tick_length
+            ticks = self.max_ticks_per_frame
+        else:
+            self.accumulator -= ticks * self.tick_length
+        return ticks
+
+    #method that returns whether or not it is time to draw a frame
+    def render_due(self):
+        now = self.clock()
+        if self.next_render is None or now >= self.next_render:
+            #schedule the next frame one frame length later, or right away if we're more than a frame behind
+            self.next_render = max(now, (self.next_render or now) + self.render_length)
+            return True
+        return False
+
+    #method that returns how long the loop can sleep before the next tick or frame is due
+    def time_until_next(self):
+        now = self.clock()
+        until_tick = self.tick_length - self.accumulator - (now - (self.last_time or now))
+        until_render = (self.next_render or now) - now
+        return max(0.0, min(until_tick, until_render))
+
+#test code for the FixedTimestep scheduler, using a fake clock so it runs instantly
+def timestep_tester():
+    now = [0.0]
+    scheduler = FixedTimestep(tick_rate = 10, render_rate = 4, max_ticks_per_frame = 5, clock = lambda: now[0])
+    assert scheduler.ticks_due() == 0, 'no time has passed yet'
+    assert scheduler.render_due(), 'the first frame should be drawn right away'
+    now[0] = 0.25
+    assert scheduler.ticks_due() == 2, 'a quarter second at 10 ticks/sec is 2 ticks'
+    assert scheduler.render_due(), 'a quarter second at 4 frames/sec is a frame'
+    assert not scheduler.render_due(), 'only one frame should be due'
+    #leftover time carries over to the next call
+    now[0] = 0.31
+    assert scheduler.ticks_due() == 1, 'the leftover 0.05 seconds plus 0.06 seconds is 1 tick'
+    #a long stall only runs max_ticks_per_frame ticks and skips the rest
+    now[0] = 2.31
+    assert scheduler.ticks_due() == 5, 'a stall should be capped at max_ticks_per_frame'
+    assert scheduler.skipped_ticks == 15, 'the rest of the stall should be skipped'
+    assert scheduler.ticks_due() == 0, 'skipped ticks should not come back later'
+    assert 0 <= scheduler.time_until_next() <= 0.1, 'the next tick is at most a tick length away'
+
+    print('All tests passed!')
+
+#test code for the incremental Renderer, drawing with a fake dudraw that only writes down the calls made to it
+def renderer_tester():
+    global dudraw
+
+    class FakeDudraw:
+        BLACK, RED, WHITE = 'black', 'red', 'white'
+
+        def __init__(self):
+            self.calls = []
+
+        def __getattr__(self, name):
+            return lambda *args: self.calls.append((name,) + args)
+
+    real = dudraw
+    dudraw = fake = FakeDudraw()
+    try:
+        game = SnakeGame(1)
+        renderer = Renderer()
+        renderer.draw(game)
+        assert ('clear', 'black') in fake.calls, 'the first frame should be a full redraw'
+        fake.calls.clear()
+        renderer.draw(game)
+        assert fake.calls == [], 'a frame where nothing changed should draw nothing'
+        game.step()
+        renderer.draw(game)
+        assert 0 < len(fake.calls) < 30, 'a tick should take a few draw calls'
+        #run into a wall, then keep drawing frames with no ticks in between
+        while not game.game_over:
+            game.step()
+        fake.calls.clear()
+        renderer.draw(game)
+        assert fake.calls[-1][0] == 'text' and fake.calls[-1][-1] == 'GAME OVER', 'the message should be drawn last'
+        fake.calls.clear()
+        renderer.draw(game)
+        assert fake.calls == [], 'a finished game should draw nothing more'
+        #a square under the message being repainted puts the message back on top
+        x, y = game_over_squares(game.width, game.height)[0]
+        game.snake.grid.changed.append(y * game.width + x)
+        renderer.draw(game)
+        assert fake.calls[-1][-1] == 'GAME OVER', 'the message should be drawn again over a repainted square'
+    finally:
+        dudraw = real
+
+    print('All tests passed!')
+
+#returns the keys typed since the last call, oldest first
+#dudraw keeps typed keys in a set and only collects them when it shows a frame, which loses the order of keys typed
+#close together (w then a could come back as a then w) and merges a key typed twice into one. So the key presses are
+#read straight from pygame's event queue instead, giving each key the same name dudraw would, and dudraw's record of
+#which keys are held down is kept up to date so it doesn't trip over the release of a key it never saw pressed
+def typed_keys():
+    import pygame
+    state = dudraw.dudraw
+    #keys dudraw picked up while showing the last frame were typed before anything still in the queue
+    keys = list(dudraw.keys_typed())
+    for event in pygame.event.get((pygame.KEYDOWN, pygame.KEYUP)):
+        key = pygame.key.name(event.key) if event.unicode == '' else event.unicode
+        if event.type == pygame.KEYDOWN:
+            keys.append(key)
+            state._keys_pressed.add(key)
+        else:
+            state._keys_pressed.discard(key)
+            state._keys_released.add(key)
+    return keys
+
+#main animation loop: a thin dudraw front end over the SnakeGame engine
+#tick_rate is how many times per second the snake moves and render_rate is how many frames are drawn per second
+#width and height are the size of the world, in squares, and every game is recorded as a replay in record_dir if it's given
+def main(tick_rate: float = 10.0, render_rate: float = 30.0, width: int = GRID_WIDTH, height: int = GRID_HEIGHT, record_dir = None,
+         autopilot_on: bool = False, profile_path = None):
+    if dudraw is None:
+        raise ImportError("dudraw is required to play the interactive game")
+    dudraw.set_canvas_size(600, 600)
+    #create the game engine, which holds the snake, the food and the score
+    game = SnakeGame(width = width, height = height)
+    #the renderer only repaints what changed between frames. Big worlds are drawn as a stretched pixel buffer
+    if width > PIXEL_RENDER_SIZE or height > PIXEL_RENDER_SIZE:
+        renderer = PixelRenderer()
+    else:
+        renderer = Renderer()
+    #the scheduler keeps the game ticking at tick_rate no matter how long drawing takes
+    scheduler = FixedTimestep(tick_rate, render_rate)
+    #the autopilot steers the snake while it's switched on (p switches it on and off). Its search arrays are set up
+    #now, since that takes a moment on huge worlds and would stall the game the first time p is pressed
+    from snake_autopilot import Autopilot
+    autopilot = Autopilot(time_budget = 0.5 / tick_rate)
+    autopilot.setup(width, height)
+    #the profiler times each phase of the loop while it's switched on (t switches it on and off, --profile starts it on)
+    from snake_profiler import TickProfiler
+    profiler = TickProfiler(export_path = profile_path, draw_module = dudraw)
+    game.profiler = profiler
+    if profile_path is not None:
+        profiler.enable()
+    key = '' #create an empty key variable for our animation loop condition
+    #set the x and y scale so our world is a width x height grid
+    dudraw.set_x_scale(0, width)
+    dudraw.set_y_scale(0, height)
+    #continue while q has not been pressed:
+    while key != 'q':
+        profiler.begin_frame()
+        #process every keyboard press since the last pass, in the order they were typed. Keys are read on every pass
+        #through the loop (at least once per tick), not just when a frame is shown
+        for key in typed_keys():
+            if key == 'q':
+                break
+            #add an extra check that only allows the snake to be moved if the game is not over.
+            #this prevents the user from being able to continue after crashing
+            #w, a, s and d queue a turn for the next move. The queue rejects turns back onto the snake itself
+            if not game.game_over and key in KEY_DIRECTIONS:
+                game.snake.queue_turn(KEY_DIRECTIONS[key])
+            if key == 'p':
+                autopilot_on = not autopilot_on
+            if key == 't' and not profiler.toggle():
+                print(profiler.summary())
+        #add an extra condition so that when r is pressed, the game restarts
+        if key == 'r':
+            game.reset()
+        #start recording a new game once it's about to start moving (r keeps restarting the game until another key is pressed)
+        if record_dir is not None and game.ticks == 0 and game.recorder is None and key != 'r':
+            from snake_replay import ReplayRecorder
+            ReplayRecorder(os.path.join(record_dir, f"{game.seed}.snkr"), game)
+        #advance the game by however many ticks are due (the autopilot's thinking counts as input)
+        ticks = scheduler.ticks_due()
+        for tick in range(ticks):
+            action = autopilot.choose(game) if autopilot_on and not game.game_over else None
+            profiler.lap('input')
+            game.step(action)
+        #draw and show the canvas when a frame is due, otherwise wait until the next tick or frame
+        drew = scheduler.render_due()
+        if drew:
+            renderer.draw(game)
+            profiler.lap('draw')
+            dudraw.show(0)
+            profiler.lap('show')
+        profiler.end_frame(ticks, drew, game.snake.body.get_size())
+        if not drew:
+            time.sleep(scheduler.time_until_next())
+    #keep the turns of a game that was quit before it ended
+    game.stop_recording()
+    profiler.disable()
+
+if __name__ == '__main__':
+    #the other snake_*.py modules import this file by name. Point that name at this copy of it, so they use the same
+    #classes as the game instead of loading the file a second time
+    sys.modules.setdefault('sanger_project1_TheGameOfSnake', sys.modules[__name__])
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Play the game of snake')
+    parser.add_argument('--tick-rate', type = float, default = 10.0, help = 'snake moves per second (default 10)')
+    parser.add_argument('--render-rate', type = float, default = 30.0, help = 'frames drawn per second (default 30)')
+    parser.add_argument('--width', type = int, default = GRID_WIDTH, help = 'width of the world in squares (default 20)')
+    parser.add_argument('--height', type = int, default = GRID_HEIGHT, help = 'height of the world in squares (default 20)')
+    parser.add_argument('--record', metavar = 'DIR', help = 'record every game as a replay file in DIR')
+    parser.add_argument('--autopilot', action = 'store_true', help = 'start with the autopilot steering (p switches it on and off)')
+    parser.add_argument('--profile', metavar = 'FILE', help = 'profile the game loop from the start, writing the numbers to FILE '
+                        'every few seconds (Prometheus text for .prom or .txt, JSON otherwise)')
+    parser.add_argument('--test', action = 'store_true', help = 'run the tests instead of the game (no dudraw needed)')
+    args = parser.parse_args()
+    if args.test:
+        run_tests()
+    else:
+        main(args.tick_rate, args.render_rate, args.width, args.height, args.record, args.autopilot, args.profile)
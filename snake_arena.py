@@ -0,0 +1,461 @@
+from __future__ import annotations
+import argparse
+import random
+import sys
+import time
+
+from sanger_project1_TheGameOfSnake import KEY_DIRECTIONS, FixedTimestep, Food, Grid, PixelRenderer, Snake, dudraw, typed_keys
+
+"""
+    An arena where many snakes share one world and several pieces of food:
+
+        python snake_arena.py --snakes 200 --foods 40 --width 128 --height 128
+        python snake_arena.py --snakes 500 --width 256 --height 256 --headless --ticks 1000
+
+    Every snake moves into the same occupancy Grid, so a snake has crashed exactly when its head is on a square covered
+    more than once, whether that's its own body, another snake's body or another snake's head. That makes the crash
+    check for each snake constant time (it is Snake.has_crashed, unchanged), and a tick costs about the same per snake
+    no matter how many snakes there are or how long they get. Food is kept in a dictionary by square, so eating is
+    constant time too. Snakes are steered by policies (greedy, random or the autopilot), and with --human the first
+    snake is steered with w, a, s and d.
+"""
+
+#the directions a snake can go, and how far its head moves in x and y for each
+DIRECTIONS = ('up', 'right', 'down', 'left')
+CHANGES = {'up': (0, 1), 'right': (1, 0), 'down': (0, -1), 'left': (-1, 0)}
+OPPOSITES = {'up': 'down', 'down': 'up', 'left': 'right', 'right': 'left'}
+#how many random squares spawn tries before deciding there's no room for another snake
+SPAWN_TRIES = 100
+
+
+class Arena:
+    def __init__(self, snakes: int = 10, foods: int = 5, width: int = 64, height: int = 64, seed = None,
+                 body_class = None, respawn: bool = False):
+        """
+            parameters:
+                snakes: how many snakes to start with (fewer fit if the world runs out of room)
+                foods: how many pieces of food are on the board at once
+                width, height: the size of the world, in squares
+                seed: seed for the random number generator that places snakes and food
+                respawn: whether snakes that die come back somewhere else (with their score set back to 0)
+        """
+        self.width = width
+        self.height = height
+        self.body_class = body_class
+        self.respawn = respawn
+        self.rng = random.Random(seed)
+        #the occupancy grid every snake moves in
+        self.grid = Grid(width, height)
+        self.snakes = []
+        self.alive = []
+        self.scores = []
+        #why each dead snake died: 'wall', 'body' (its own or another snake's) or 'head' (head to head, including two
+        #heads that swapped squares), None while alive
+        self.causes = []
+        #each piece of food, by the index of its square (row by row, like Grid), and the food there was no room for yet,
+        #which is placed again every tick until it fits
+        self.foods = {}
+        self.pending = []
+        self.ticks = 0
+        for i in range(snakes):
+            snake = self.spawn()
+            if snake is None:
+                break
+            self.add_snake(snake)
+        for i in range(foods):
+            food = Food(0, 0)
+            if not self.place_food(food):
+                self.pending.append(food)
+
+    #the index of the square the segment is on, or -1 if it's outside the world
+    def square(self, segment):
+        if self.grid.in_bounds(segment.x_loc, segment.y_loc):
+            return int(segment.y_loc) * self.width + int(segment.x_loc)
+        return -1
+
+    #adds a snake that is already on the grid, returning its index
+    def add_snake(self, snake: Snake):
+        self.snakes.append(snake)
+        self.alive.append(True)
+        self.scores.append(0)
+        self.causes.append(None)
+        return len(self.snakes) - 1
+
+    #puts the snake with the given squares ((x, y) lower-left corners from the head back) going in direction on the grid
+    def place_snake(self, squares, direction: str):
+        return Snake(self.body_class, self.width, self.height, self.grid,
+                     [(x + 0.5, y + 0.5) for x, y in squares], direction)
+
+    #returns a new three segment snake on empty squares in a random spot going in a random direction,
+    #or None if no room was found
+    def spawn(self):
+        for i in range(SPAWN_TRIES):
+            head = self.grid.random_free_square(self.rng)
+            if head is None:
+                return None
+            direction = self.rng.choice(DIRECTIONS)
+            change_x, change_y = CHANGES[direction]
+            x, y = int(head[0]), int(head[1])
+            #the body trails behind the head, and the two squares in front are kept clear so it doesn't die right away
+            squares = [(x - change_x * i, y - change_y * i) for i in range(-2, 3)]
+            if all(self.grid.count(sx + 0.5, sy + 0.5) == 0 and self.grid.in_bounds(sx + 0.5, sy + 0.5)
+                   and sy * self.width + sx not in self.foods for sx, sy in squares):
+                return self.place_snake(squares[2:], direction)
+        return None
+
+    #moves food to a random empty square without food on it, returning False if there is nowhere to put it
+    def place_food(self, food: Food):
+        for i in range(SPAWN_TRIES):
+            square = self.grid.random_free_square(self.rng)
+            if square is None:
+                return False
+            index = int(square[1]) * self.width + int(square[0])
+            if index not in self.foods:
+                food.x_loc, food.y_loc = square
+                self.foods[index] = food
+                return True
+        return False
+
+    def step(self, actions = None):
+        """
+            parameters:
+                actions: a list with the direction each snake should turn to (None to keep going), or None for no turns
+            return:
+                a tuple (rewards, died): the reward of each snake (1 for eating, -1 for crashing, 0 otherwise)
+                and the indexes of the snakes that died on this tick
+            moves every living snake at once: all of them move, then the ones on food eat and grow,
+            then every head is checked for crashes, and only then are the dead snakes taken off the board
+        """
+        self.ticks += 1
+        snakes = self.snakes
+        alive = self.alive
+        #how many heads are on each square, and the (from, to) squares of every head, to tell head to head crashes apart
+        heads = {}
+        moves = {}
+        for i, snake in enumerate(snakes):
+            if not alive[i]:
+                continue
+            if actions is not None and actions[i] is not None:
+                snake.turn(actions[i])
+            before = self.square(snake.body.first())
+            snake.move()
+            square = self.square(snake.body.first())
+            heads[square] = heads.get(square, 0) + 1
+            moves[i] = (before, square)
+        rewards = [0] * len(snakes)
+        eaten = []
+        for i, snake in enumerate(snakes):
+            if not alive[i]:
+                continue
+            food = self.foods.pop(self.square(snake.body.first()), None)
+            if food is not None:
+                snake.grow()
+                self.scores[i] += 1
+                rewards[i] = 1
+                eaten.append(food)
+        died = [i for i, snake in enumerate(snakes) if alive[i] and snake.has_crashed()]
+        #two heads that swapped squares ran into each other just like two heads on one square
+        swapped = set(moves.values())
+        for i in died:
+            before, square = moves[i]
+            self.causes[i] = 'wall' if square < 0 else 'head' if heads[square] > 1 or (square, before) in swapped else 'body'
+            rewards[i] = -1
+            self.remove(i)
+        #eaten food goes somewhere else, along with any food that didn't fit before
+        self.pending = [food for food in self.pending + eaten if not self.place_food(food)]
+        if self.respawn:
+            for i in died:
+                snake = self.spawn()
+                if snake is not None:
+                    snakes[i] = snake
+                    alive[i] = True
+                    self.scores[i] = 0
+                    self.causes[i] = None
+        return rewards, died
+
+    #takes a dead snake off the board
+    def remove(self, i: int):
+        snake = self.snakes[i]
+        for segment in snake.body:
+            self.grid.vacate(segment.x_loc, segment.y_loc)
+        snake.direction = None
+        self.alive[i] = False
+
+    #returns the number of snakes still alive
+    def alive_count(self):
+        return sum(self.alive)
+
+
+#a policy that heads for the closest food without running into anything it can see next to its head.
+#each snake remembers which food it's going for, so the closest food is only looked for again once that one is eaten
+class GreedyPolicy:
+    def __init__(self):
+        self.targets = {}
+
+    def __call__(self, arena: Arena, i: int):
+        snake = arena.snakes[i]
+        head = snake.body.first()
+        x, y = int(head.x_loc), int(head.y_loc)
+        target = self.targets.get(i)
+        if target is None or target not in arena.foods:
+            if not arena.foods:
+                target = None
+            else:
+                target = min(arena.foods, key = lambda square: abs(square % arena.width - x) + abs(square // arena.width - y))
+            self.targets[i] = target
+        best = None
+        best_distance = None
+        for direction in DIRECTIONS:
+            if direction == OPPOSITES.get(snake.direction):
+                continue
+            change_x, change_y = CHANGES[direction]
+            if arena.grid.count(x + change_x + 0.5, y + change_y + 0.5) > 0 or \
+               not arena.grid.in_bounds(x + change_x + 0.5, y + change_y + 0.5):
+                continue
+            distance = 0 if target is None else abs(target % arena.width - x - change_x) + abs(target // arena.width - y - change_y)
+            #ties keep going the same way
+            if best is None or distance < best_distance or distance == best_distance and direction == snake.direction:
+                best = direction
+                best_distance = distance
+        return best
+
+
+#lets the Autopilot from snake_autopilot.py steer arena snakes. The autopilot steers a game, so each snake gets a view
+#of the arena that looks like one: its own snake, the closest food and the tick. Other snakes are on the shared grid,
+#so the autopilot steers around them like it does around its own body. Each snake has its own autopilot, and with it
+#search arrays the size of the world, so this is for a handful of snakes (greedy is the one for crowds)
+class AutopilotPolicy:
+    def __init__(self, time_budget: float = 0.001):
+        self.time_budget = time_budget
+        self.autopilots = {}
+        self.views = {}
+
+    def __call__(self, arena: Arena, i: int):
+        from snake_autopilot import Autopilot
+        if i not in self.autopilots:
+            self.autopilots[i] = Autopilot(self.time_budget)
+        view = self.views.get(i)
+        if view is None or view.snake is not arena.snakes[i]:
+            #a new snake (or a respawned one) gets a new view, so the autopilot knows it's a new game
+            view = ArenaView(arena.snakes[i])
+            self.views[i] = view
+        if not arena.foods:
+            return None
+        head = arena.snakes[i].body.first()
+        square = min(arena.foods, key = lambda square: abs(square % arena.width + 0.5 - head.x_loc) +
+                                                       abs(square // arena.width + 0.5 - head.y_loc))
+        view.food = arena.foods[square]
+        view.ticks = arena.ticks
+        return self.autopilots[i].choose(view)
+
+
+#what the autopilot sees of an arena: one snake, one food and the tick
+class ArenaView:
+    def __init__(self, snake: Snake):
+        self.snake = snake
+        self.food = None
+        self.ticks = 0
+
+
+#a policy that turns a quarter of the time, to a random direction
+def random_policy(arena: Arena, i: int):
+    if arena.rng.random() < 0.25:
+        return arena.rng.choice(DIRECTIONS)
+    return None
+
+
+POLICIES = {'greedy': GreedyPolicy, 'autopilot': AutopilotPolicy, 'random': lambda: random_policy}
+
+
+#draws an arena into a pixel buffer (one pixel per square) stretched over the canvas, repainting only what changed,
+#so drawing costs about the same no matter how many snakes there are or how long they are
+class ArenaRenderer(PixelRenderer):
+    def __init__(self):
+        super().__init__()
+        self.arena = None
+        self.food_squares = set()
+
+    def draw(self, arena: Arena):
+        import pygame
+        grid = arena.grid
+        if arena is not self.arena:
+            self.pixels = bytearray(grid.width * grid.height * 3)
+            for index in range(grid.width * grid.height):
+                if grid.cells[index] > 0:
+                    self.paint_square(grid, index)
+            grid.changed = []
+            self.arena = arena
+            self.food_squares = set()
+        else:
+            for index in set(grid.changed):
+                self.paint_square(grid, index)
+            grid.changed.clear()
+        #repaint the squares food was eaten from, then paint the food
+        foods = set(arena.foods)
+        for index in self.food_squares - foods:
+            self.paint_square(grid, index)
+        for index in foods:
+            self.set_pixel(grid, index, (255, 0, 0))
+        self.food_squares = foods
+        image = pygame.image.frombuffer(self.pixels, (grid.width, grid.height), 'RGB')
+        canvas = dudraw.dudraw._surface
+        canvas.blit(pygame.transform.scale(image, canvas.get_size()), (0, 0))
+        dudraw.set_pen_color(dudraw.WHITE)
+        dudraw.set_font_size(15)
+        dudraw.text(arena.width * 0.2, arena.height * 0.95,
+                    f"Alive: {arena.alive_count()}  Best: {max(arena.scores, default = 0)}")
+
+
+#returns the action of every snake: from its policy, or nothing for the snake steered with the keyboard
+def choose_actions(arena: Arena, policy, human: bool):
+    return [None if not alive or human and i == 0 else policy(arena, i) for i, alive in enumerate(arena.alive)]
+
+
+#runs an arena without drawing it for the given number of ticks, printing how fast it went
+def run_headless(arena: Arena, policy, ticks: int):
+    start = time.perf_counter()
+    moves = 0
+    for tick in range(ticks):
+        moves += arena.alive_count()
+        arena.step(choose_actions(arena, policy, False))
+    elapsed = time.perf_counter() - start
+    print(f"{ticks} ticks in {elapsed:.2f}s: {ticks / elapsed:,.0f} ticks/sec, {moves / elapsed:,.0f} snake moves/sec, "
+          f"{arena.alive_count()} of {len(arena.snakes)} snakes alive, best score {max(arena.scores, default = 0)}")
+
+
+#the interactive arena, drawn with dudraw. With human set, the first snake is steered with w, a, s and d
+def main(arena: Arena, policy, human: bool = False, tick_rate: float = 10.0, render_rate: float = 30.0):
+    if dudraw is None:
+        raise ImportError("dudraw is required to watch the arena")
+    dudraw.set_canvas_size(600, 600)
+    dudraw.set_x_scale(0, arena.width)
+    dudraw.set_y_scale(0, arena.height)
+    renderer = ArenaRenderer()
+    scheduler = FixedTimestep(tick_rate, render_rate)
+    quit = False
+    while not quit:
+        #read the keys every pass, in the order they were typed, so two quick turns are queued one after the other
+        for key in typed_keys():
+            if key == 'q':
+                quit = True
+                break
+            if human and arena.alive[0] and key in KEY_DIRECTIONS:
+                arena.snakes[0].queue_turn(KEY_DIRECTIONS[key])
+        for tick in range(scheduler.ticks_due()):
+            if arena.alive_count() > 0:
+                arena.step(choose_actions(arena, policy, human))
+        if scheduler.render_due():
+            renderer.draw(arena)
+            if arena.alive_count() == 0:
+                dudraw.set_pen_color(dudraw.RED)
+                dudraw.set_font_size(20)
+                dudraw.text(arena.width / 2, arena.height / 2, "GAME OVER")
+            dudraw.show(0)
+        else:
+            time.sleep(scheduler.time_until_next())
+
+
+#test code for the arena: the different kinds of crashes, keeping the shared grid right, and a crowd of snakes
+def arena_tester():
+    #head to head: two snakes going straight at each other meet in the middle square
+    arena = Arena(0, 0, 12, 10, seed = 1)
+    left = arena.add_snake(arena.place_snake([(3, 5), (2, 5), (1, 5)], 'right'))
+    right = arena.add_snake(arena.place_snake([(5, 5), (6, 5), (7, 5)], 'left'))
+    rewards, died = arena.step()
+    assert sorted(died) == [left, right] and arena.causes == ['head', 'head'], 'head to head should kill both snakes'
+    assert arena.grid.cells == bytearray(12 * 10), 'dead snakes should be taken off the grid'
+
+    #head to body: a snake turning into the side of another dies, the other one lives
+    arena = Arena(0, 0, 12, 10, seed = 1)
+    wall = arena.add_snake(arena.place_snake([(5, 7), (5, 6), (5, 5), (5, 4), (5, 3)], 'up'))
+    runner = arena.add_snake(arena.place_snake([(4, 5), (3, 5), (2, 5)], 'right'))
+    rewards, died = arena.step()
+    assert died == [runner] and arena.causes[runner] == 'body' and arena.alive[wall], 'running into a body kills only the runner'
+    assert rewards[runner] == -1, 'dying should be a reward of -1'
+
+    #two heads next to each other going at each other swap squares, which is a head to head crash too
+    arena = Arena(0, 0, 12, 10, seed = 1)
+    left = arena.add_snake(arena.place_snake([(4, 5), (3, 5), (2, 5)], 'right'))
+    right = arena.add_snake(arena.place_snake([(5, 5), (6, 5), (7, 5)], 'left'))
+    rewards, died = arena.step()
+    assert sorted(died) == [left, right] and arena.causes == ['head', 'head'], 'swapping heads should be a head to head crash'
+
+    #a snake may follow right behind another's tail, since every tail moves out before heads are checked
+    arena = Arena(0, 0, 12, 10, seed = 1)
+    arena.add_snake(arena.place_snake([(5, 5), (4, 5), (3, 5)], 'right'))
+    arena.add_snake(arena.place_snake([(2, 5), (1, 5), (0, 5)], 'right'))
+    rewards, died = arena.step()
+    assert died == [], 'following a tail should be safe'
+
+    #walls, and eating
+    arena = Arena(0, 0, 12, 10, seed = 1)
+    arena.add_snake(arena.place_snake([(11, 2), (10, 2), (9, 2)], 'right'))
+    eater = arena.add_snake(arena.place_snake([(3, 2), (2, 2), (1, 2)], 'right'))
+    food = Food(4.5, 2.5)
+    arena.foods[2 * 12 + 4] = food
+    rewards, died = arena.step()
+    assert died == [0] and arena.causes[0] == 'wall', 'leaving the world is a wall crash'
+    assert rewards[eater] == 1 and arena.snakes[eater].body.get_size() == 4 and len(arena.foods) == 1, 'eating should grow and move the food'
+
+    #food with nowhere to go waits until there is room for it
+    arena = Arena(0, 0, 3, 1, seed = 1)
+    snake = arena.add_snake(arena.place_snake([(1, 0), (0, 0)], 'right'))
+    arena.pending = [food for food in (Food(0, 0), Food(0, 0)) if not arena.place_food(food)]
+    assert len(arena.foods) == 1 and len(arena.pending) == 1, 'only one piece of food fits next to the snake'
+    rewards, died = arena.step()
+    assert rewards[snake] == 1 and not died, 'the snake should eat the food in front of it'
+    assert not arena.foods and len(arena.pending) == 2, 'the board is full, so both pieces should wait'
+    rewards, died = arena.step()
+    assert died == [snake] and len(arena.foods) == 2 and not arena.pending, 'once the snake is gone both should be placed'
+
+    #a crowd of snakes: the grid should always hold exactly the living snakes
+    for policy_name in ('greedy', 'random'):
+        arena = Arena(150, 30, 64, 64, seed = 1353, respawn = True)
+        policy = POLICIES[policy_name]()
+        for tick in range(200):
+            arena.step(choose_actions(arena, policy, False))
+        cells = bytearray(64 * 64)
+        for i, snake in enumerate(arena.snakes):
+            if arena.alive[i]:
+                for segment in snake.body:
+                    if arena.grid.in_bounds(segment.x_loc, segment.y_loc):
+                        cells[int(segment.y_loc) * 64 + int(segment.x_loc)] += 1
+        assert arena.grid.cells == cells, f'the shared grid should match the living snakes ({policy_name})'
+        assert len(arena.foods) == 30, 'eaten food should come back'
+        assert all(arena.grid.cells[square] == 0 for square in arena.foods), 'food should be on empty squares'
+    assert max(arena.scores) > 0, 'greedy snakes should eat something'
+
+    #the autopilot steers arena snakes too
+    arena = Arena(4, 6, 20, 20, seed = 7)
+    policy = AutopilotPolicy()
+    for tick in range(200):
+        arena.step(choose_actions(arena, policy, False))
+    assert sum(arena.scores) > 0, 'autopilot snakes should eat something'
+
+    print('All tests passed!')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Many snakes in one world')
+    parser.add_argument('--snakes', type = int, default = 50, help = 'number of snakes (default 50)')
+    parser.add_argument('--foods', type = int, default = 20, help = 'pieces of food on the board at once (default 20)')
+    parser.add_argument('--width', type = int, default = 64, help = 'width of the world in squares (default 64)')
+    parser.add_argument('--height', type = int, default = 64, help = 'height of the world in squares (default 64)')
+    parser.add_argument('--policy', choices = sorted(POLICIES), default = 'greedy', help = 'what steers the snakes')
+    parser.add_argument('--human', action = 'store_true', help = 'steer the first snake with w, a, s and d')
+    parser.add_argument('--respawn', action = 'store_true', help = 'dead snakes come back somewhere else')
+    parser.add_argument('--seed', type = int, help = 'seed for placing the snakes and food')
+    parser.add_argument('--tick-rate', type = float, default = 10.0, help = 'moves per second (default 10)')
+    parser.add_argument('--headless', action = 'store_true', help = 'run without drawing and print how fast it went')
+    parser.add_argument('--ticks', type = int, default = 1000, help = 'ticks to run headless (default 1000)')
+    parser.add_argument('--test', action = 'store_true', help = 'run the tests instead')
+    args = parser.parse_args()
+    if args.test:
+        arena_tester()
+        sys.exit()
+    arena = Arena(args.snakes, args.foods, args.width, args.height, args.seed, respawn = args.respawn)
+    policy = POLICIES[args.policy]()
+    if args.headless:
+        run_headless(arena, policy, args.ticks)
+    else:
+        main(arena, policy, args.human, args.tick_rate)
@@ -0,0 +1,394 @@
+from __future__ import annotations
+import time
+from array import array
+from collections import deque
+
+from sanger_project1_TheGameOfSnake import SnakeGame
+
+"""
+    An autopilot that steers the snake by itself, for the interactive game (press p) and for headless runs:
+
+        autopilot = Autopilot()
+        while not game.game_over:
+            game.step(autopilot.choose(game))
+
+    Each decision has a hard time budget. The autopilot keeps a breadth-first distance field from the food over the
+    occupancy grid and reuses it tick after tick (the snake just walks down it), only starting a new one when the food
+    moves. On big worlds the field is grown a little more each tick until it reaches the snake. Before committing to a
+    path it checks the snake could still reach its tail after eating. While the field hasn't reached the snake, or the
+    path isn't safe, it only makes moves that keep its tail within reach: following a Hamiltonian cycle, taking
+    shortcuts towards the food when that can't trap it, or else the longest way round to its tail. Every square
+    covered on the grid that isn't part of the snake (another snake's, in snake_arena.py) is treated as blocked.
+"""
+
+
+def hamiltonian_cycle(width: int, height: int):
+    """
+        parameters:
+            width, height: the size of the world (at least one of them must be even)
+        return:
+            a list of (x, y) lower-left corners visiting every square once, each one next to the one before it,
+            with the last one next to the first. It zigzags across the rows from x = 1 to x = width - 1 and comes back
+            down the x = 0 column (or the same thing turned sideways when only the width is even)
+    """
+    if height % 2 != 0:
+        if width % 2 != 0:
+            raise ValueError("A world with an odd width and an odd height has no Hamiltonian cycle")
+        return [(x, y) for y, x in hamiltonian_cycle(height, width)]
+    cycle = []
+    for y in range(height):
+        columns = range(1, width) if y % 2 == 0 else range(width - 1, 0, -1)
+        for x in columns:
+            cycle.append((x, y))
+    for y in range(height - 1, -1, -1):
+        cycle.append((0, y))
+    return cycle
+
+
+#returns the position of the square with lower-left corner (x, y) along hamiltonian_cycle(width, height), worked out
+#directly so the cycle never has to be built
+def cycle_position(width: int, height: int, x: int, y: int):
+    if height % 2 != 0:
+        return cycle_position(height, width, y, x)
+    if x == 0:
+        return height * (width - 1) + height - 1 - y
+    return y * (width - 1) + (x - 1 if y % 2 == 0 else width - 1 - x)
+
+
+class Autopilot:
+    def __init__(self, time_budget: float = 0.002, clock = time.perf_counter, node_budget: int = None):
+        """
+            parameters:
+                time_budget: the most time (in seconds) a decision may spend searching before it falls back to the cycle
+                clock: the clock used to enforce the budget
+                node_budget: the most squares a decision may search instead of a time budget. Decisions then don't
+                             depend on how fast the machine is, so a seeded game always plays out the same way
+        """
+        self.time_budget = time_budget
+        self.clock = clock
+        self.node_budget = node_budget
+        self.nodes_left = 0
+        self.width = None
+        self.height = None
+        #the distance field from the food: dist[square] is valid when seen[square] == field_id
+        self.food = None
+        #the game and tick the field was last used on, to notice a new game
+        self.game = None
+        self.ticks = 0
+        self.field_id = 0
+        self.frontier = deque()
+        #whether the path to the current food has been checked to be safe (None means not checked yet)
+        self.safe = None
+        #statistics about the decisions made so far
+        self.decisions = 0
+        self.fallbacks = 0
+        self.over_budget = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    #allocates the search arrays for a world of the given size. choose() does this itself the first time it sees a
+    #world of a new size, but that takes a moment on huge worlds, so the interactive game calls it at startup
+    def setup(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        size = width * height
+        self.dist = array('i', [0]) * size
+        self.seen = array('i', [0]) * size
+        #mark, own and visit are stamped with increasing ids instead of being cleared between searches
+        self.mark = array('i', [0]) * size
+        self.mark_id = 0
+        self.own = array('i', [0]) * size
+        self.own_id = 0
+        self.visit = array('i', [0]) * size
+        self.visit_id = 0
+        self.food = None
+        #whether the world has a Hamiltonian cycle to follow (see cycle_position)
+        self.has_cycle = width % 2 == 0 or height % 2 == 0
+
+    #the squares next to square that are inside the world
+    def neighbors(self, square: int):
+        x = square % self.width
+        if x > 0:
+            yield square - 1
+        if x < self.width - 1:
+            yield square + 1
+        if square >= self.width:
+            yield square - self.width
+        if square < (self.height - 1) * self.width:
+            yield square + self.width
+
+    #the direction that moves the head from square a to the neighbouring square b
+    def direction(self, a: int, b: int):
+        if b == a + 1:
+            return 'right'
+        if b == a - 1:
+            return 'left'
+        if b > a:
+            return 'up'
+        return 'down'
+
+    def choose(self, game: SnakeGame):
+        """
+            parameters:
+                game: the game to steer
+            return:
+                the direction the snake should turn to (pass it to game.step), or None to keep going
+        """
+        grid = game.snake.grid
+        #setting up for a new world size isn't counted against the budget
+        if grid.width != self.width or grid.height != self.height:
+            self.setup(grid.width, grid.height)
+        start = self.clock()
+        deadline = start + self.time_budget
+        self.nodes_left = self.node_budget
+        head = game.snake.body.first()
+        if not grid.in_bounds(head.x_loc, head.y_loc):
+            return None
+        head_square = int(head.y_loc) * self.width + int(head.x_loc)
+        tail = game.snake.body.last()
+        tail_square = int(tail.y_loc) * self.width + int(tail.x_loc) if grid.in_bounds(tail.x_loc, tail.y_loc) else -1
+        #the squares the head can move into: empty ones, and the tail's square since the tail moves out of the way first
+        cells = grid.cells
+        candidates = [square for square in self.neighbors(head_square)
+                      if cells[square] == 0 or square == tail_square and cells[square] == 1]
+
+        choice = None
+        food_square = int(game.food.y_loc) * self.width + int(game.food.x_loc)
+        if food_square != self.food or game is not self.game or game.ticks < self.ticks:
+            self.game = game
+            self.start_field(food_square)
+        #walk down the distance field towards the food, growing the field until it reaches one of the candidates
+        best = self.closest_to_food(candidates, grid, deadline)
+        if best is not None:
+            if self.safe is None:
+                self.safe = self.path_is_safe(game, best, deadline)
+            if self.safe is not False:
+                #a check that ran out of time is tried again on the next tick, and the snake keeps going meanwhile
+                choice = best
+            else:
+                #check again on the next tick, since the snake will have moved
+                self.safe = None
+        if choice is None:
+            self.fallbacks += 1
+            choice = self.fallback(game, candidates, head_square, tail_square, food_square, deadline)
+            #the field is only kept up to date by the snake walking down it, so it has to start over after leaving a
+            #path it knew about, or once it's finished without reaching the snake. A field that is still growing
+            #towards the snake is kept
+            if best is not None or not self.frontier:
+                self.food = None
+
+        self.ticks = game.ticks
+        elapsed = self.clock() - start
+        self.decisions += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        if elapsed > self.time_budget:
+            self.over_budget += 1
+        return self.direction(head_square, choice) if choice is not None else None
+
+    #throws away the old distance field and starts a new one from the food
+    def start_field(self, food_square: int):
+        self.food = food_square
+        self.field_id += 1
+        self.seen[food_square] = self.field_id
+        self.dist[food_square] = 0
+        self.frontier = deque([food_square])
+        self.safe = None
+
+    #returns the candidate closest to the food according to the distance field, growing the field (breadth first
+    #from the food) until it reaches a candidate or the deadline passes. Returns None if no candidate is in the field
+    def closest_to_food(self, candidates, grid, deadline):
+        seen = self.seen
+        dist = self.dist
+        field_id = self.field_id
+        cells = grid.cells
+        frontier = self.frontier
+        width = self.width
+        size = len(cells)
+        reached = any(seen[square] == field_id for square in candidates)
+        expanded = 0
+        #this is the hot loop on big worlds, so the neighbours are worked out inline (-1 stands for off the edge)
+        while frontier and not reached:
+            square = frontier.popleft()
+            moves = dist[square] + 1
+            x = square % width
+            for neighbor in (square - 1 if x > 0 else -1, square + 1 if x < width - 1 else -1,
+                             square - width, square + width):
+                if 0 <= neighbor < size and seen[neighbor] != field_id and cells[neighbor] == 0:
+                    seen[neighbor] = field_id
+                    dist[neighbor] = moves
+                    frontier.append(neighbor)
+                    if neighbor in candidates:
+                        reached = True
+            expanded += 1
+            if expanded & 255 == 0 and self.out_of_budget(deadline, 256):
+                break
+        best = None
+        for square in candidates:
+            if seen[square] == field_id and (best is None or dist[square] < dist[best]):
+                best = square
+        return best
+
+    #returns whether the snake could still reach its tail after following the distance field from first to the food
+    #and eating it, or None if the deadline passed before it could tell
+    def path_is_safe(self, game: SnakeGame, first: int, deadline):
+        #follow the field down to the food to get the path
+        path = [first]
+        while self.dist[path[-1]] > 0:
+            step = None
+            for neighbor in self.neighbors(path[-1]):
+                if self.seen[neighbor] == self.field_id and self.dist[neighbor] == self.dist[path[-1]] - 1:
+                    step = neighbor
+                    break
+            if step is None:
+                return False
+            path.append(step)
+        #the body after eating: the path (newest square first) followed by the front of the current body,
+        #one segment longer than the snake is now
+        length = game.snake.body.get_size() + 1
+        body = path[::-1][:length]
+        for square in self.stamp_own(game):
+            if len(body) == length:
+                break
+            body.append(square)
+        self.mark_id += 1
+        for square in body:
+            self.mark[square] = self.mark_id
+        distance = self.reachable(body[0], body[-1], deadline, game.snake.grid.cells)
+        return None if distance is None else distance > 0
+
+    #stamps every square of the snake's body with a new own_id, so reachable can tell the snake's own squares apart
+    #from the ones other snakes cover. Returns the squares from the head back
+    def stamp_own(self, game: SnakeGame):
+        self.own_id += 1
+        squares = []
+        for segment in game.snake.body:
+            if game.snake.grid.in_bounds(segment.x_loc, segment.y_loc):
+                square = int(segment.y_loc) * self.width + int(segment.x_loc)
+                self.own[square] = self.own_id
+                squares.append(square)
+        return squares
+
+    #returns how many moves it takes to get from start to target without crossing squares stamped with the current
+    #mark_id, or squares covered in cells by something other than the snake stamped in own (the target itself may be
+    #blocked): 0 if it can't be reached, or None if the deadline passed first
+    def reachable(self, start: int, target: int, deadline, cells):
+        if start == target:
+            return 1
+        self.visit_id += 1
+        visit = self.visit
+        visit_id = self.visit_id
+        mark = self.mark
+        mark_id = self.mark_id
+        own = self.own
+        own_id = self.own_id
+        visit[start] = visit_id
+        frontier = deque([(start, 1)])
+        expanded = 0
+        while frontier:
+            square, moves = frontier.popleft()
+            for neighbor in self.neighbors(square):
+                if neighbor == target:
+                    return moves + 1
+                if visit[neighbor] != visit_id and mark[neighbor] != mark_id and (cells[neighbor] == 0 or own[neighbor] == own_id):
+                    visit[neighbor] = visit_id
+                    frontier.append((neighbor, moves + 1))
+            expanded += 1
+            if expanded & 63 == 0 and self.out_of_budget(deadline, 64):
+                return None
+        return 0
+
+    #returns whether the decision has used up its budget, having searched another nodes squares since the last check
+    def out_of_budget(self, deadline, nodes: int):
+        if self.node_budget is None:
+            return self.clock() > deadline
+        self.nodes_left -= nodes
+        return self.nodes_left <= 0
+
+    #picks a move when there is no safe path to the food. Only moves that keep the tail within reach are considered,
+    #so the snake can always follow its own tail until a safe path opens up. Among those it follows the Hamiltonian
+    #cycle, cutting ahead towards the food when the cut doesn't jump past the tail; without a cycle (or when the cycle
+    #move isn't safe) it stalls by taking the longest way round to its tail
+    def fallback(self, game: SnakeGame, candidates, head_square: int, tail_square: int, food_square: int, deadline):
+        if not candidates:
+            return None
+        if tail_square < 0:
+            return candidates[0]
+        self.mark_id += 1
+        for square in self.stamp_own(game):
+            self.mark[square] = self.mark_id
+        #the head is moving out of its square, which is still blocked (the body follows it)
+        distances = {}
+        cells = game.snake.grid.cells
+        for square in candidates:
+            distance = self.reachable(square, tail_square, deadline, cells)
+            if distance is None:
+                #out of time: take the first move that isn't a crash
+                return candidates[0]
+            if distance > 0:
+                distances[square] = distance
+        if not distances:
+            return candidates[0]
+        if self.has_cycle:
+            size = self.width * self.height
+            position = lambda square: cycle_position(self.width, self.height, square % self.width, square // self.width)
+            head_position = position(head_square)
+            ahead = lambda square: (position(square) - head_position) % size
+            #leave room for the snake to grow while it catches up with the cycle
+            room = ahead(tail_square) - 4
+            best = None
+            for square in distances:
+                distance = ahead(square)
+                if distance < room and distance <= ahead(food_square) and (best is None or distance > ahead(best)):
+                    best = square
+            if best is not None:
+                return best
+        return max(distances, key = distances.get)
+
+
+#test code that lets the autopilot play seeded games and checks it plays well and stays within its time budget
+def autopilot_tester(games: int = 10):
+    #the cycle positions match the cycle, for both ways round
+    for width, height in ((6, 4), (7, 4), (6, 5), (2, 2)):
+        cycle = hamiltonian_cycle(width, height)
+        assert [cycle_position(width, height, x, y) for x, y in cycle] == list(range(width * height)), 'cycle_position is off'
+    #squares covered by something else (another snake) are blocked, unlike the snake's own squares
+    game = SnakeGame(0, width = 10, height = 10)
+    autopilot = Autopilot()
+    autopilot.setup(10, 10)
+    head, tail = game.snake.body.first(), game.snake.body.last()
+    start = int(head.y_loc) * 10 + int(head.x_loc) + 10
+    target = int(tail.y_loc) * 10 + int(tail.x_loc)
+    #block the snake's own body, the way fallback does
+    autopilot.mark_id += 1
+    for square in autopilot.stamp_own(game):
+        autopilot.mark[square] = autopilot.mark_id
+    assert autopilot.reachable(start, target, float('inf'), game.snake.grid.cells) > 0, 'the tail should be in reach'
+    #another snake wrapped around the tail
+    for x, y in ((tail.x_loc - 1, tail.y_loc), (tail.x_loc + 1, tail.y_loc), (tail.x_loc, tail.y_loc - 1)):
+        game.snake.grid.occupy(x, y)
+    assert autopilot.reachable(start, target, float('inf'), game.snake.grid.cells) == 0, 'the other snake should block the way'
+    scores = []
+    autopilot = Autopilot()
+    for seed in range(games):
+        game = SnakeGame(seed, width = 10, height = 10)
+        while not game.game_over and game.ticks < 5000:
+            game.step(autopilot.choose(game))
+        scores.append(game.score)
+    average = sum(scores) / len(scores)
+    assert average >= 40, f'the autopilot should fill a good part of a 10x10 world, scored {scores}'
+    #a huge world: the distance field is built over several ticks, and decisions stay cheap
+    game = SnakeGame(0, width = 1024, height = 1024)
+    autopilot = Autopilot(time_budget = 0.002)
+    while game.score < 2 and not game.game_over and game.ticks < 5000:
+        game.step(autopilot.choose(game))
+    assert game.score >= 2 and not game.game_over, 'the autopilot should find food on a huge world'
+    assert autopilot.max_time < 0.05, f'decisions should stay near the budget, took up to {autopilot.max_time:.4f}s'
+    print(f'average score {average:.1f} on 10x10, mean decision {autopilot.total_time / autopilot.decisions * 1e6:.0f} us '
+          f'on 1024x1024')
+
+    print('All tests passed!')
+
+
+if __name__ == '__main__':
+    autopilot_tester()
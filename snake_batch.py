@@ -0,0 +1,249 @@
+from __future__ import annotations
+import random
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+    A vectorized version of the snake game that keeps many games in NumPy arrays and advances all of them
+    with one call to step(actions). The rules are the same as Snake.move/grow/has_crashed and Food.generate in
+    sanger_project1_TheGameOfSnake.py, and games that finish are automatically restarted.
+
+    Positions are stored as the integer lower-left corner of each square (the scalar game's x_loc - 0.5),
+    and directions are stored as numbers (see DIRECTIONS).
+"""
+
+#direction numbers used by the batch game, in clockwise order so a turn is valid exactly when it changes the number by an odd amount
+DIRECTIONS = ('up', 'right', 'down', 'left')
+#how far the head moves in x and y for each direction number
+CHANGE_X = (0, 1, 0, -1)
+CHANGE_Y = (1, 0, -1, 0)
+
+
+class BatchSnakeGame:
+    def __init__(self, n: int, width: int = 20, height: int = 20, seed = None):
+        """
+            parameters:
+                n: the number of games to run side by side
+                width, height: the size of the world, in squares
+                seed: seed for the random number generator used to place food
+        """
+        if np is None:
+            raise ImportError("numpy is required for BatchSnakeGame")
+        self.n = n
+        self.width = width
+        self.height = height
+        self.rng = np.random.default_rng(seed)
+        #every game can hold a snake covering every square twice over, which is more than a game can ever reach
+        self.capacity = 2 * width * height
+        self.games = np.arange(n)
+        self.change_x = np.array(CHANGE_X, dtype = np.int16)
+        self.change_y = np.array(CHANGE_Y, dtype = np.int16)
+        #the body of each game is a ring buffer: segment i is at (head[g] + i) % capacity
+        self.body_x = np.zeros((n, self.capacity), dtype = np.int16)
+        self.body_y = np.zeros((n, self.capacity), dtype = np.int16)
+        self.head = np.zeros(n, dtype = np.int64)
+        self.length = np.zeros(n, dtype = np.int64)
+        #the number of segments covering each square of each game, stored row by row
+        self.occupancy = np.zeros((n, width * height), dtype = np.uint8)
+        self.food_x = np.zeros(n, dtype = np.int16)
+        self.food_y = np.zeros(n, dtype = np.int16)
+        #the direction number of each snake, or -1 once it has crashed
+        self.direction = np.zeros(n, dtype = np.int8)
+        self.score = np.zeros(n, dtype = np.int64)
+        self.ticks = np.zeros(n, dtype = np.int64)
+        self.done = np.zeros(n, dtype = bool)
+        self.won = np.zeros(n, dtype = bool)
+        #the score and tick count each game finished with, the last time it finished
+        self.final_score = np.zeros(n, dtype = np.int64)
+        self.final_ticks = np.zeros(n, dtype = np.int64)
+        self.reset()
+
+    def reset(self, games = None):
+        """
+            parameters:
+                games: the indexes (or a boolean mask) of the games to restart, defaults to all of them
+            starts the chosen games over with the same starting snake and food as SnakeGame.reset
+        """
+        if games is None:
+            games = self.games
+        elif getattr(games, 'dtype', None) == bool:
+            games = np.flatnonzero(games)
+        if len(games) == 0:
+            return
+        start_x = self.width * 3 // 5
+        start_y = self.height * 2 // 5
+        self.occupancy[games] = 0
+        self.head[games] = 0
+        self.length[games] = 3
+        for i in range(3):
+            self.body_x[games, i] = start_x
+            self.body_y[games, i] = start_y - i
+            self.occupancy[games, (start_y - i) * self.width + start_x] += 1
+        self.food_x[games] = self.width // 4
+        self.food_y[games] = self.height * 4 // 5
+        self.direction[games] = 0
+        self.score[games] = 0
+        self.ticks[games] = 0
+        self.done[games] = False
+        self.won[games] = False
+
+    #returns which of the positions (xs, ys) are inside the world
+    def in_bounds(self, xs, ys):
+        return (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+
+    #adds change (+1 or -1) to the occupancy of square (xs[i], ys[i]) in game games[i], skipping squares outside the world
+    def update_occupancy(self, games, xs, ys, change):
+        inside = self.in_bounds(xs, ys)
+        games = games[inside]
+        squares = ys[inside].astype(np.int64) * self.width + xs[inside]
+        if change > 0:
+            self.occupancy[games, squares] += 1
+        else:
+            self.occupancy[games, squares] -= 1
+
+    def get_state(self):
+        """
+            return:
+                an (n, 6) array with a row (head_x, head_y, food_x, food_y, direction, score) per game,
+                the batch version of SnakeGame.get_state
+        """
+        return np.stack([self.body_x[self.games, self.head], self.body_y[self.games, self.head],
+                         self.food_x, self.food_y, self.direction, self.score], axis = 1).astype(np.int64)
+
+    def set_food(self, game: int, x: int, y: int):
+        #moves the food of one game to the square with lower-left corner (x, y)
+        self.food_x[game] = x
+        self.food_y[game] = y
+
+    def step(self, actions = None):
+        """
+            parameters:
+                actions: an array of n direction numbers to turn to before moving (-1 to keep going straight),
+                         or None to keep every snake going straight. Turns back onto the snake are ignored
+            return:
+                a tuple (state, rewards, dones) like SnakeGame.step, with one entry per game.
+                Games that finish on this tick are restarted before step returns, so state is the state of the new game
+                for them; their final score is in final_score
+        """
+        games = self.games
+        alive = ~self.done
+        #turn: only turns perpendicular to the current direction are allowed
+        if actions is not None:
+            actions = np.asarray(actions, dtype = np.int8)
+            turning = alive & (actions >= 0) & ((actions - self.direction) % 2 == 1)
+            self.direction = np.where(turning, actions, self.direction).astype(np.int8)
+        moving = games[alive]
+        direction = self.direction[moving]
+        #move: free up the last segment's square, then put the last segment in front of the head
+        tail = (self.head[moving] + self.length[moving] - 1) % self.capacity
+        self.update_occupancy(moving, self.body_x[moving, tail], self.body_y[moving, tail], -1)
+        head_x = self.body_x[moving, self.head[moving]] + self.change_x[direction]
+        head_y = self.body_y[moving, self.head[moving]] + self.change_y[direction]
+        self.head[moving] = (self.head[moving] - 1) % self.capacity
+        self.body_x[moving, self.head[moving]] = head_x
+        self.body_y[moving, self.head[moving]] = head_y
+        self.update_occupancy(moving, head_x, head_y, 1)
+        self.ticks[moving] += 1
+        rewards = np.zeros(self.n, dtype = np.int64)
+
+        #eat: grow by one segment past the last one, in the direction the last two segments are lined up in
+        ate = (head_x == self.food_x[moving]) & (head_y == self.food_y[moving])
+        eating = moving[ate]
+        if len(eating) > 0:
+            last = (self.head[eating] + self.length[eating] - 1) % self.capacity
+            second_to_last = (self.head[eating] + self.length[eating] - 2) % self.capacity
+            last_x = self.body_x[eating, last]
+            last_y = self.body_y[eating, last]
+            change_x = self.body_x[eating, second_to_last] - last_x
+            change_y = self.body_y[eating, second_to_last] - last_y
+            #the same order of checks as Snake.grow
+            below = change_y > 0
+            right = ~below & (change_x < 0)
+            above = ~below & ~right & (change_y < 0)
+            left = ~below & ~right & ~above & (change_x > 0)
+            grows = below | right | above | left
+            new_x = last_x + right - left
+            new_y = last_y - below + above
+            growing = eating[grows]
+            slot = (self.head[growing] + self.length[growing]) % self.capacity
+            self.body_x[growing, slot] = new_x[grows]
+            self.body_y[growing, slot] = new_y[grows]
+            self.length[growing] += 1
+            self.update_occupancy(growing, new_x[grows], new_y[grows], 1)
+            self.score[eating] += 1
+            rewards[eating] = 1
+            self.place_food(eating)
+        won = self.won[moving]
+
+        #crash: into a wall, or into itself (the head's square is covered more than once)
+        inside = self.in_bounds(head_x, head_y)
+        squares = np.where(inside, head_y.astype(np.int64) * self.width + head_x, 0)
+        crashed = ~won & (~inside | (self.occupancy[moving, squares] > 1))
+        crashing = moving[crashed]
+        rewards[crashing] = -1
+        self.direction[crashing] = -1
+        self.done[crashing] = True
+
+        dones = self.done.copy()
+        #restart every finished game
+        finished = np.flatnonzero(dones)
+        self.final_score[finished] = self.score[finished]
+        self.final_ticks[finished] = self.ticks[finished]
+        self.reset(finished)
+        return self.get_state(), rewards, dones
+
+    #moves the food of each of the given games to an empty square chosen uniformly at random, or ends the game as a win
+    #when the snake covers every square
+    def place_food(self, games):
+        empty = self.occupancy[games] == 0
+        #the empty square with the largest random key is a uniformly random empty square
+        keys = np.where(empty, self.rng.random(empty.shape), -1.0)
+        squares = keys.argmax(axis = 1)
+        full = ~empty.any(axis = 1)
+        placing = games[~full]
+        self.food_x[placing] = squares[~full] % self.width
+        self.food_y[placing] = squares[~full] // self.width
+        self.won[games[full]] = True
+        self.done[games[full]] = True
+
+
+#test code that plays the same games with BatchSnakeGame and the scalar SnakeGame and checks they stay identical
+#the batch game places food with its own random numbers, so after each meal the test copies the scalar game's food over
+def batch_tester(n: int = 64, ticks: int = 3000):
+    from sanger_project1_TheGameOfSnake import SnakeGame
+    batch = BatchSnakeGame(n, seed = 1353)
+    scalar = [SnakeGame(g) for g in range(n)]
+    rng = random.Random(1353)
+    finished = 0
+    for tick in range(ticks):
+        actions = [rng.choice((-1, -1, -1, 0, 1, 2, 3)) for g in range(n)]
+        state, rewards, dones = batch.step(actions)
+        for g in range(n):
+            game = scalar[g]
+            _, reward, done = game.step(DIRECTIONS[actions[g]] if actions[g] >= 0 else None)
+            assert reward == rewards[g] and done == dones[g], 'batch game disagrees on reward or done!'
+            if done:
+                assert batch.final_score[g] == game.score, 'batch game disagrees on the final score!'
+                game.reset(g)
+                finished += 1
+                continue
+            if reward == 1:
+                #the batch food should be on an empty square, then it follows the scalar game's food
+                assert batch.occupancy[g, batch.food_y[g] * batch.width + batch.food_x[g]] == 0, 'food landed on the snake!'
+                batch.set_food(g, int(game.food.x_loc), int(game.food.y_loc))
+            body = [(int(segment.x_loc - 0.5), int(segment.y_loc - 0.5)) for segment in game.snake.body]
+            slots = [(batch.head[g] + i) % batch.capacity for i in range(batch.length[g])]
+            assert body == [(batch.body_x[g, s], batch.body_y[g, s]) for s in slots], 'batch snake body disagrees!'
+            assert DIRECTIONS[batch.direction[g]] == game.snake.direction, 'batch direction disagrees!'
+            assert batch.score[g] == game.score, 'batch score disagrees!'
+            assert bytes(batch.occupancy[g]) == bytes(game.snake.grid.cells), 'batch occupancy disagrees!'
+    assert finished > 0, 'some games should have finished'
+
+    print('All tests passed!')
+
+
+if __name__ == '__main__':
+    batch_tester()
@@ -0,0 +1,325 @@
+from __future__ import annotations
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from sanger_project1_TheGameOfSnake import (DoublyLinkedList, Food, GameState, Grid, SegmentRingBuffer, Snake, SnakeGame,
+                                            SnakeSegment)
+from snake_autopilot import hamiltonian_cycle
+
+"""
+    Benchmarks for the snake game's data structures and the hot paths of a game tick.
+    Everything runs headless (no dudraw needed). Results can be saved as JSON and compared
+    against the results from another commit:
+
+        python snake_benchmarks.py --output before.json
+        python snake_benchmarks.py --output after.json --compare before.json
+"""
+
+#the body classes every snake benchmark is run with
+BODY_CLASSES = {'linked': DoublyLinkedList, 'ring': SegmentRingBuffer}
+
+
+#the direction that takes a snake from square a to the neighbouring square b
+def direction_between(a, b):
+    if b[0] > a[0]:
+        return 'right'
+    if b[0] < a[0]:
+        return 'left'
+    if b[1] > a[1]:
+        return 'up'
+    return 'down'
+
+
+#builds a snake of the given length lying along the cycle, with its head on cycle[length - 1]
+#the snake can then follow the cycle forever without crashing
+def snake_on_cycle(cycle, length: int, body_class = DoublyLinkedList, grid: Grid = None):
+    snake = Snake(body_class)
+    snake.body = body_class()
+    snake.grid = grid if grid is not None else Grid()
+    for i in range(length - 1, -1, -1):
+        x, y = cycle[i]
+        snake.body.add_last(SnakeSegment(x + 0.5, y + 0.5))
+        snake.grid.occupy(x + 0.5, y + 0.5)
+    snake.direction = direction_between(cycle[length - 2], cycle[length - 1])
+    return snake
+
+
+#the directions to follow each step of the cycle, starting from the step out of cycle[0]
+def cycle_directions(cycle):
+    return [direction_between(cycle[i], cycle[(i + 1) % len(cycle)]) for i in range(len(cycle))]
+
+
+#returns the p-th percentile (0-100) of a sorted list of samples
+def percentile(samples, p):
+    if not samples:
+        return 0
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def measure(operation, count: int, samples: int = 2000):
+    """
+        parameters:
+            operation: a function taking the number of times to run the operation being measured
+            count: the total number of operations to time
+            samples: how many individually timed single operations to take for the latency percentiles
+        return:
+            a dictionary with ops/sec, p50/p99 latency in nanoseconds, and the memory retained and peak per operation
+        runs operation(count) once for throughput, then times single operations for latency,
+        then runs it again under tracemalloc to see how much memory each operation allocates
+    """
+    operation(min(count, 100))
+    start = time.perf_counter()
+    operation(count)
+    elapsed = time.perf_counter() - start
+    latencies = []
+    for i in range(samples):
+        begin = time.perf_counter_ns()
+        operation(1)
+        latencies.append(time.perf_counter_ns() - begin)
+    latencies.sort()
+    traced = min(count, 10000)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    operation(traced)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'ops_per_sec': count / elapsed if elapsed > 0 else float('inf'),
+        'p50_ns': percentile(latencies, 50),
+        'p99_ns': percentile(latencies, 99),
+        'retained_bytes_per_op': (after - before) / traced,
+        'peak_bytes': peak - before,
+    }
+
+
+#benchmarks for the DoublyLinkedList (and SegmentRingBuffer) operations at a given size
+def bench_list(body_class, size: int, count: int):
+    results = {}
+    body = body_class()
+    for i in range(size):
+        body.add_last(SnakeSegment(i + 0.5, 0.5))
+    segment = SnakeSegment(0.5, 0.5)
+
+    def add_first_remove_last(n):
+        for i in range(n):
+            body.add_first(segment)
+            body.remove_last()
+    results['add_first+remove_last'] = measure(add_first_remove_last, count)
+
+    rng = random.Random(size)
+    indexes = [rng.randrange(size) for i in range(1024)]
+
+    def get_random(n):
+        for i in range(n):
+            body.get(indexes[i & 1023])
+    results['get(random)'] = measure(get_random, count)
+
+    def get_sequential(n):
+        for i in range(n):
+            body.get(i % size)
+    results['get(sequential)'] = measure(get_sequential, count)
+
+    if hasattr(body, 'search'):
+        missing = SnakeSegment(-1.5, -1.5)
+
+        def search_missing(n):
+            for i in range(n):
+                body.search(missing)
+        results['search(miss)'] = measure(search_missing, max(1, count // size))
+    return results
+
+
+#benchmarks for the snake's hot paths at a given length on a width x height grid
+def bench_snake(body_class, length: int, width: int, height: int, count: int):
+    results = {}
+    cycle = hamiltonian_cycle(width, height)
+    directions = cycle_directions(cycle)
+    snake = snake_on_cycle(cycle, length, body_class, Grid(width, height))
+    position = [length - 1]
+
+    def move(n):
+        step = position[0]
+        for i in range(n):
+            snake.direction = directions[step]
+            snake.move()
+            step += 1
+            if step == len(cycle):
+                step = 0
+        position[0] = step
+    results['Snake.move'] = measure(move, count)
+
+    def has_crashed(n):
+        for i in range(n):
+            snake.has_crashed()
+    results['Snake.has_crashed'] = measure(has_crashed, count)
+
+    food = Food(0.5, 0.5)
+
+    def has_found_food(n):
+        for i in range(n):
+            snake.has_found_food(food)
+    results['Snake.has_found_food'] = measure(has_found_food, count)
+
+    rng = random.Random(length)
+
+    def generate(n):
+        for i in range(n):
+            food.generate(snake.grid, rng)
+    if snake.grid.free_count() > 0:
+        results['Food.generate'] = measure(generate, count)
+
+    #grow the snake, then take the new segment off again so every grow sees the same snake
+    def grow(n):
+        for i in range(n):
+            size = snake.body.get_size()
+            snake.grow()
+            if snake.body.get_size() > size:
+                tail = snake.body.remove_last()
+                snake.grid.vacate(tail.x_loc, tail.y_loc)
+    results['Snake.grow'] = measure(grow, count)
+
+    #one step of lookahead from a copy of the snake, the way a search bot would use it
+    squares = [(int(segment.x_loc - 0.5), int(segment.y_loc - 0.5)) for segment in snake.body]
+    state = GameState(width, height, 0, 0, snake.direction, None, squares)
+    following = directions[position[0]]
+
+    def lookahead(n):
+        for i in range(n):
+            state.step(following)
+    results['GameState.step'] = measure(lookahead, count)
+    return results
+
+
+#benchmark for whole game ticks with a simple policy that avoids turning back and restarts finished games
+def bench_game(body_class, count: int, width: int = 20, height: int = 20):
+    game = SnakeGame(0, body_class, width, height)
+    rng = random.Random(0)
+    actions = [rng.choice(('up', 'down', 'left', 'right', None, None, None, None)) for i in range(4096)]
+    tick = [0]
+
+    def step(n):
+        t = tick[0]
+        for i in range(n):
+            state, reward, done = game.step(actions[t & 4095])
+            if done:
+                game.reset(t)
+            t += 1
+        tick[0] = t
+    return {'SnakeGame.step': measure(step, count)}
+
+
+#benchmark that re-simulates a recorded replay (see snake_replay.py) from start to finish, checking it still ends the same
+def bench_replay(path: str, count: int):
+    from snake_replay import Replay
+    replay = Replay(path, snapshot_interval = 0)
+    ticks = [0]
+
+    def play(n):
+        for i in range(n):
+            ticks[0] += replay.verify().ticks
+    runs = max(1, count // max(1, replay.final_ticks or replay.turn_count))
+    result = measure(play, runs, samples = min(runs, 200))
+    result['ticks_per_sec'] = result['ops_per_sec'] * (replay.final_ticks or 0)
+    replay.close()
+    return {'Replay.verify': result}
+
+
+#returns the current git commit, if the benchmarks are run from a git checkout
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(lengths, grids, count: int, bodies, replays = ()):
+    """
+        parameters:
+            lengths: the snake lengths (and list sizes) to benchmark on the 20x20 grid
+            grids: (width, height) pairs of larger grids to benchmark a half-full snake on
+            count: how many operations to time for each throughput number
+            bodies: the names of the body classes to benchmark (keys of BODY_CLASSES)
+            replays: paths of recorded replay files to play back as fixtures
+        return:
+            a list of result dictionaries, one per benchmark
+    """
+    results = []
+
+    def record(group, params, numbers):
+        for name, result in numbers.items():
+            entry = {'name': name, 'group': group}
+            entry.update(params)
+            entry.update(result)
+            results.append(entry)
+            print(f"{name:24} {group:6} {json.dumps(params):40} {result['ops_per_sec']:>14,.0f} ops/sec  "
+                  f"p50 {result['p50_ns']:>7} ns  p99 {result['p99_ns']:>7} ns  "
+                  f"{result['retained_bytes_per_op']:.2f} B/op retained", file = sys.stderr)
+
+    for body_name in bodies:
+        body_class = BODY_CLASSES[body_name]
+        for length in lengths:
+            record(body_name, {'size': length}, bench_list(body_class, length, count))
+            record(body_name, {'length': length, 'grid': [20, 20]}, bench_snake(body_class, length, 20, 20, count))
+        for width, height in grids:
+            length = width * height // 2
+            record(body_name, {'length': length, 'grid': [width, height]}, bench_snake(body_class, length, width, height, count))
+        for width, height in [(20, 20)] + grids:
+            record(body_name, {'grid': [width, height]}, bench_game(body_class, count, width, height))
+    for path in replays:
+        record('replay', {'replay': path}, bench_replay(path, count))
+    return results
+
+
+#prints how each benchmark changed compared to an older results file
+def compare(results, old_path: str):
+    with open(old_path) as f:
+        old = json.load(f)
+    key = lambda entry: json.dumps({k: v for k, v in entry.items() if k in ('name', 'group', 'size', 'length', 'grid', 'replay')}, sort_keys = True)
+    before = {key(entry): entry for entry in old['results']}
+    print(f"compared with {old_path} (commit {old.get('commit')}):")
+    for entry in results:
+        previous = before.get(key(entry))
+        if previous is None:
+            continue
+        ratio = entry['ops_per_sec'] / previous['ops_per_sec'] if previous['ops_per_sec'] else float('inf')
+        print(f"  {key(entry)}: {ratio:.2f}x ops/sec")
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark the snake game data structures and game tick')
+    parser.add_argument('--lengths', type = int, nargs = '+', default = [3, 10, 50, 200, 399, 400],
+                        help = 'snake lengths to benchmark on the 20x20 grid (default: 3 up to a full board, which '
+                               'skips Food.generate since there is nowhere to put the food)')
+    parser.add_argument('--grids', type = str, nargs = '*', default = ['64x64', '256x256'],
+                        help = 'larger grids to benchmark a half-full snake on, as WIDTHxHEIGHT (height must be even)')
+    parser.add_argument('--count', type = int, default = 20000, help = 'operations per throughput measurement')
+    parser.add_argument('--bodies', nargs = '+', choices = sorted(BODY_CLASSES), default = sorted(BODY_CLASSES),
+                        help = 'body classes to benchmark')
+    parser.add_argument('--replays', nargs = '*', default = [], help = 'replay files to play back as regression fixtures')
+    parser.add_argument('--output', help = 'write the results to this JSON file')
+    parser.add_argument('--compare', help = 'compare the results with an earlier JSON results file')
+    args = parser.parse_args(argv)
+    grids = [tuple(int(n) for n in grid.lower().split('x')) for grid in args.grids]
+    results = run_benchmarks(args.lengths, grids, args.count, args.bodies, args.replays)
+    report = {
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent = 1)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
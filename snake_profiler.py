@@ -0,0 +1,299 @@
+from __future__ import annotations
+import json
+import os
+import sys
+import time
+from array import array
+
+"""
+    A per-phase profiler for the game loop, cheap enough to leave in and switch on while playing (press t, or start
+    the game with --profile FILE).
+
+    The loop calls begin_frame() at the top of each pass, lap(phase) after each phase and end_frame() at the bottom.
+    SnakeGame.step laps the move, food, generate and crash phases itself when its profiler is set, and main laps input,
+    draw and show. Each frame also records how many draw calls it made (by counting calls to the drawing functions
+    of the dudraw module while the profiler is on), the change in the number of allocated memory blocks (so steady
+    per-frame garbage shows up as a non-zero number) and the length of the snake. The last capacity frames are kept in
+    ring buffers for the p50/p99 numbers, and every export_interval seconds the numbers are written to export_path,
+    as Prometheus text if the file name ends in .prom or .txt and as JSON otherwise.
+"""
+
+#the phases of a frame, in the order they happen
+PHASES = ('input', 'move', 'food', 'generate', 'crash', 'draw', 'show')
+#the drawing functions of dudraw that count as draw calls
+DRAW_FUNCTIONS = ('clear', 'filled_square', 'filled_circle', 'filled_rectangle', 'filled_polygon', 'square', 'circle',
+                  'rectangle', 'polygon', 'line', 'point', 'text', 'picture')
+
+
+#returns the p-th percentile (0-100) of a sorted list of samples
+def percentile(samples, p):
+    if not samples:
+        return 0
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+class TickProfiler:
+    def __init__(self, capacity: int = 1024, export_path: str = None, export_interval: float = 5.0, draw_module = None,
+                 clock = time.perf_counter_ns):
+        """
+            parameters:
+                capacity: how many of the most recent frames to keep samples for
+                export_path: the file to write the numbers to every export_interval seconds (None to not export)
+                draw_module: the module whose drawing functions are counted as draw calls while profiling (usually dudraw)
+                clock: a clock returning nanoseconds
+        """
+        self.capacity = capacity
+        self.export_path = export_path
+        self.export_interval = export_interval
+        self.draw_module = draw_module
+        self.clock = clock
+        self.enabled = False
+        #one ring buffer of nanoseconds per phase, plus the whole frame, and ring buffers for the other numbers
+        self.samples = {phase: array('q', bytes(8 * capacity)) for phase in PHASES + ('frame',)}
+        self.draw_samples = array('q', bytes(8 * capacity))
+        self.block_samples = array('q', bytes(8 * capacity))
+        self.length_samples = array('q', bytes(8 * capacity))
+        #the slot the next frame goes in, and how many frames have been recorded since the profiler was switched on
+        self.index = 0
+        self.frames = 0
+        #running totals since the profiler was switched on, for the Prometheus sums
+        self.totals = dict.fromkeys(PHASES + ('frame',), 0)
+        self.ticks = 0
+        #the frame being measured: time spent in each phase so far, when the last lap ended, and the counters at the start
+        self.current = dict.fromkeys(PHASES, 0)
+        self.last = None
+        self.frame_start = None
+        self.blocks = 0
+        self.draw_calls = 0
+        self.originals = {}
+        self.last_export = None
+
+    #switches profiling on, starting the samples over
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self.index = 0
+        self.frames = 0
+        self.totals = dict.fromkeys(PHASES + ('frame',), 0)
+        self.ticks = 0
+        self.last_export = self.clock()
+        if self.draw_module is not None:
+            self.count_draw_calls(self.draw_module)
+
+    #switches profiling off, so the loop only pays for a few attribute checks
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.last = None
+        #put the drawing functions back the way they were
+        for name, function in self.originals.items():
+            setattr(self.draw_module, name, function)
+        self.originals = {}
+        if self.export_path is not None:
+            self.export()
+
+    #switches profiling on or off, returning whether it is now on
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+        return self.enabled
+
+    #replaces the drawing functions of module with ones that count their calls before drawing
+    def count_draw_calls(self, module):
+        for name in DRAW_FUNCTIONS:
+            function = getattr(module, name, None)
+            if function is None:
+                continue
+            self.originals[name] = function
+
+            def counted(*args, function = function, **kwargs):
+                self.draw_calls += 1
+                return function(*args, **kwargs)
+            setattr(module, name, counted)
+
+    #starts measuring a frame
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        for phase in PHASES:
+            self.current[phase] = 0
+        self.draw_calls = 0
+        self.blocks = sys.getallocatedblocks()
+        self.frame_start = self.last = self.clock()
+
+    #adds the time since the last lap (or the start of the frame) to phase
+    def lap(self, phase: str):
+        if self.last is None:
+            return
+        now = self.clock()
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def end_frame(self, ticks: int = 1, drew: bool = True, length: int = 0):
+        """
+            parameters:
+                ticks: how many game ticks ran in this frame
+                drew: whether the frame was drawn
+                length: the length of the snake, to see how the phases change as it grows
+            records the frame in the ring buffers, unless nothing happened in it (a pass of the loop that only slept)
+        """
+        if self.last is None:
+            return
+        now = self.clock()
+        self.last = None
+        if ticks == 0 and not drew:
+            return
+        index = self.index
+        for phase in PHASES:
+            self.samples[phase][index] = self.current[phase]
+            self.totals[phase] += self.current[phase]
+        self.samples['frame'][index] = now - self.frame_start
+        self.totals['frame'] += now - self.frame_start
+        self.draw_samples[index] = self.draw_calls
+        self.block_samples[index] = sys.getallocatedblocks() - self.blocks
+        self.length_samples[index] = length
+        self.index = (index + 1) % self.capacity
+        self.frames += 1
+        self.ticks += ticks
+        if self.export_path is not None and now - self.last_export >= self.export_interval * 1e9:
+            self.last_export = now
+            self.export()
+
+    #the samples in a ring buffer that hold recorded frames, sorted
+    def recorded(self, ring):
+        return sorted(ring[:min(self.frames, self.capacity)])
+
+    def report(self):
+        """
+            return:
+                a dictionary with the p50 and p99 of each phase (in nanoseconds), the draw calls and the allocated
+                blocks per frame over the recorded frames, plus the totals since the profiler was switched on
+        """
+        phases = {}
+        for phase in PHASES + ('frame',):
+            samples = self.recorded(self.samples[phase])
+            phases[phase] = {'p50_ns': percentile(samples, 50), 'p99_ns': percentile(samples, 99),
+                             'total_ns': self.totals[phase]}
+        draws = self.recorded(self.draw_samples)
+        blocks = self.recorded(self.block_samples)
+        return {
+            'frames': self.frames,
+            'ticks': self.ticks,
+            'length': self.length_samples[(self.index - 1) % self.capacity] if self.frames else 0,
+            'phases': phases,
+            'draw_calls': {'p50': percentile(draws, 50), 'p99': percentile(draws, 99)},
+            'allocated_blocks': {'p50': percentile(blocks, 50), 'p99': percentile(blocks, 99)},
+        }
+
+    #the report in the Prometheus text exposition format
+    def prometheus(self):
+        report = self.report()
+        lines = ['# HELP snake_phase_seconds Time spent in each phase of a frame of the game loop',
+                 '# TYPE snake_phase_seconds summary']
+        for phase, numbers in report['phases'].items():
+            lines.append(f'snake_phase_seconds{{phase="{phase}",quantile="0.5"}} {numbers["p50_ns"] / 1e9:.9f}')
+            lines.append(f'snake_phase_seconds{{phase="{phase}",quantile="0.99"}} {numbers["p99_ns"] / 1e9:.9f}')
+            lines.append(f'snake_phase_seconds_sum{{phase="{phase}"}} {numbers["total_ns"] / 1e9:.9f}')
+            lines.append(f'snake_phase_seconds_count{{phase="{phase}"}} {report["frames"]}')
+        for name, help_text in (('draw_calls', 'Draw calls per frame'),
+                                ('allocated_blocks', 'Change in allocated memory blocks per frame')):
+            lines.append(f'# HELP snake_{name} {help_text}')
+            lines.append(f'# TYPE snake_{name} summary')
+            lines.append(f'snake_{name}{{quantile="0.5"}} {report[name]["p50"]}')
+            lines.append(f'snake_{name}{{quantile="0.99"}} {report[name]["p99"]}')
+        lines.append('# HELP snake_ticks_total Game ticks since profiling was switched on')
+        lines.append('# TYPE snake_ticks_total counter')
+        lines.append(f'snake_ticks_total {report["ticks"]}')
+        lines.append('# HELP snake_length Length of the snake in the last recorded frame')
+        lines.append('# TYPE snake_length gauge')
+        lines.append(f'snake_length {report["length"]}')
+        return '\n'.join(lines) + '\n'
+
+    #writes the numbers to path (export_path by default), replacing the file in one go so readers never see half of it
+    def export(self, path: str = None):
+        path = path or self.export_path
+        if path is None:
+            raise ValueError("export needs a path when the profiler has no export_path")
+        if path.endswith('.prom') or path.endswith('.txt'):
+            text = self.prometheus()
+        else:
+            text = json.dumps(self.report(), indent = 1)
+        with open(path + '.tmp', 'w') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+    #a few lines to print when profiling is switched off
+    def summary(self):
+        report = self.report()
+        lines = [f"{report['frames']} frames, {report['ticks']} ticks, snake length {report['length']}"]
+        for phase, numbers in report['phases'].items():
+            lines.append(f"  {phase:9} p50 {numbers['p50_ns'] / 1000:9.1f} us  p99 {numbers['p99_ns'] / 1000:9.1f} us")
+        lines.append(f"  draw calls p50 {report['draw_calls']['p50']}  p99 {report['draw_calls']['p99']}, "
+                     f"allocated blocks p50 {report['allocated_blocks']['p50']}  p99 {report['allocated_blocks']['p99']}")
+        return '\n'.join(lines)
+
+
+#test code that profiles headless games with a fake clock and a fake drawing module, then exports the numbers
+def profiler_tester():
+    import tempfile
+    import types
+    from sanger_project1_TheGameOfSnake import SnakeGame
+    now = [0]
+
+    #every reading of the fake clock moves it on by 1000 ns
+    def clock():
+        now[0] += 1000
+        return now[0]
+    drawing = types.SimpleNamespace(filled_square = lambda x, y, r: None, text = lambda x, y, s: None)
+    directory = tempfile.mkdtemp()
+    profiler = TickProfiler(capacity = 64, export_path = os.path.join(directory, 'metrics.prom'), export_interval = 0.0001,
+                            draw_module = drawing, clock = clock)
+    game = SnakeGame(1, width = 12, height = 10)
+    game.profiler = profiler
+    original = drawing.filled_square
+    #switched off, nothing is recorded and the drawing functions are left alone
+    profiler.begin_frame()
+    game.step()
+    profiler.end_frame()
+    assert profiler.frames == 0 and drawing.filled_square is original, 'a switched off profiler should do nothing'
+    assert profiler.toggle() and drawing.filled_square is not original, 'toggle should switch the profiler on'
+    for frame in range(100):
+        if game.game_over:
+            game.reset(frame)
+        profiler.begin_frame()
+        profiler.lap('input')
+        game.step('left' if frame % 4 == 0 else 'up' if frame % 4 == 2 else None)
+        drawing.filled_square(0, 0, 0.5)
+        drawing.text(0, 0, 'score')
+        profiler.lap('draw')
+        profiler.end_frame(1, True, game.snake.body.get_size())
+    report = profiler.report()
+    assert report['frames'] == 100 and report['ticks'] == 100, 'every frame should be recorded'
+    #every phase that ran took exactly one clock reading (1000 ns), so that's the median of the ones that run every frame
+    for phase in ('input', 'move', 'crash', 'draw'):
+        assert report['phases'][phase]['p50_ns'] == 1000, f'{phase} should take one clock reading'
+    assert report['phases']['show']['p99_ns'] == 0, 'show never ran'
+    assert report['draw_calls']['p50'] == 2, 'two draw calls per frame should be counted'
+    assert 'snake_phase_seconds{phase="move",quantile="0.99"}' in open(profiler.export_path).read(), 'prometheus export'
+    profiler.disable()
+    assert drawing.filled_square is original, 'the drawing functions should be put back'
+    json_path = os.path.join(directory, 'metrics.json')
+    profiler.export(json_path)
+    with open(json_path) as f:
+        assert json.load(f)['frames'] == 100, 'json export'
+    #with nowhere to write to, export says so instead of failing on None
+    try:
+        TickProfiler(clock = clock).export()
+        assert False, 'export without a path should fail'
+    except ValueError:
+        pass
+
+    print('All tests passed!')
+
+
+if __name__ == '__main__':
+    profiler_tester()
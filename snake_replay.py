@@ -0,0 +1,319 @@
+from __future__ import annotations
+import bisect
+import mmap
+import struct
+import sys
+from array import array
+
+from sanger_project1_TheGameOfSnake import SnakeGame
+
+"""
+    Deterministic replays for the snake game.
+
+    A SnakeGame is fully determined by its seed, the size of the world and the turns the snake made, so a replay
+    file only stores those. The file is little-endian:
+        header: magic b'SNKR', version, width, height, (reserved), seed     (struct '<4sHHHHQ', 20 bytes)
+        one 4 byte record per turn: tick << 3 | direction code               (tick is the game tick the turn was applied on)
+        when the game finished: an end record tick << 3 | END, then the final score as another 4 byte record
+
+    Replay reads a file through mmap, re-simulates it headless as fast as the engine allows and can seek to
+    any tick using snapshots taken every snapshot_interval ticks. A snapshot holds about 8 bytes per square of the world,
+    so the snapshots are kept within snapshot_memory bytes: when there would be too many, every other one is dropped and
+    the interval doubles, which keeps them spread over the whole game. A finished replay also checks that playing it
+    back reaches the same final tick and score, so recorded games double as regression fixtures.
+"""
+
+MAGIC = b'SNKR'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHHQ')
+#direction codes stored in the low 3 bits of a record, and the code for the end record
+DIRECTIONS = ('up', 'right', 'down', 'left')
+DIRECTION_CODES = {'up': 0, 'right': 1, 'down': 2, 'left': 3}
+END = 4
+#records are buffered in memory and written out this many at a time
+FLUSH_SIZE = 4096
+#how much memory the snapshots of a replay may take, and roughly how much the random number generator's state
+#adds to each one
+SNAPSHOT_MEMORY = 256 * 2 ** 20
+RNG_STATE_BYTES = 25000
+#a snapshot takes about as long to copy as playing one tick per this many squares of the world
+SQUARES_PER_TICK = 1024
+
+
+#roughly how many bytes a snapshot of a game in a width x height world takes (see SnakeGame.snapshot)
+def snapshot_bytes(width: int, height: int):
+    return 8 * width * height + RNG_STATE_BYTES
+
+
+#records one SnakeGame into a replay file. The game must not have started yet
+class ReplayRecorder:
+    def __init__(self, path: str, game: SnakeGame):
+        if game.ticks != 0:
+            raise ValueError("A replay has to be recorded from the start of a game")
+        #the header stores the seed as an unsigned 64 bit int, so check it fits before the file is created
+        if not isinstance(game.seed, int) or not 0 <= game.seed < 2 ** 64:
+            raise ValueError(f"Only games with an int seed from 0 to 2**64 - 1 can be recorded, not {game.seed!r}")
+        self.game = game
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, game.width, game.height, 0, game.seed))
+        self.records = array('I')
+        game.recorder = self
+
+    #called by the game whenever the snake's direction changes
+    def record_turn(self, tick: int, direction):
+        self.records.append(tick << 3 | DIRECTION_CODES[direction])
+        if len(self.records) >= FLUSH_SIZE:
+            self.flush()
+
+    #called by the game when it ends: writes the end record and the final score, then closes the file
+    def record_end(self, game: SnakeGame):
+        self.records.append(game.ticks << 3 | END)
+        self.records.append(game.score)
+        self.close()
+
+    #writes the buffered records to the file
+    def flush(self):
+        if sys.byteorder == 'big':
+            self.records.byteswap()
+        self.records.tofile(self.file)
+        self.records = array('I')
+
+    #writes what's left and closes the file. A replay closed before the game ended just has no end record
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+        if self.game.recorder is self:
+            self.game.recorder = None
+
+
+#plays back a replay file
+class Replay:
+    def __init__(self, path: str, body_class = None, snapshot_interval: int = 1000, snapshot_memory: int = SNAPSHOT_MEMORY):
+        """
+            parameters:
+                path: the replay file
+                body_class: how the snake's body is stored in the games played back (see Snake)
+                snapshot_interval: the fewest ticks between snapshots (0 for no snapshots). Big worlds start further
+                                   apart, so copying the world never takes longer than playing the ticks in between
+                snapshot_memory: about how many bytes the snapshots may take altogether (at least one is always kept)
+        """
+        self.body_class = body_class
+        self.file = open(path, 'rb')
+        self.map = None
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+            if len(self.map) < HEADER.size:
+                raise ValueError(f"{path} is too short to be a snake replay")
+            magic, version, self.width, self.height, reserved, self.seed = HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} snake replay")
+            if (len(self.map) - HEADER.size) % 4 != 0:
+                raise ValueError(f"{path} is truncated")
+        except (ValueError, OSError):
+            #don't leave the file open when it can't be read as a replay
+            if self.map is not None:
+                self.map.close()
+            self.file.close()
+            raise
+        if snapshot_interval:
+            snapshot_interval = max(snapshot_interval, self.width * self.height // SQUARES_PER_TICK)
+        self.snapshot_interval = snapshot_interval
+        self.max_snapshots = max(1, snapshot_memory // snapshot_bytes(self.width, self.height))
+        self.records = memoryview(self.map)[HEADER.size:].cast('I')
+        if sys.byteorder == 'big':
+            #memoryview can't swap bytes, so big-endian machines read a swapped copy instead
+            swapped = array('I', self.records)
+            swapped.byteswap()
+            self.records.release()
+            self.records = swapped
+        #a finished replay ends with the end record and the final score
+        self.finished = len(self.records) >= 2 and self.records[-2] & 7 == END
+        if self.finished:
+            self.final_ticks = self.records[-2] >> 3
+            self.final_score = self.records[-1]
+            self.turn_count = len(self.records) - 2
+        else:
+            self.final_ticks = None
+            self.final_score = None
+            self.turn_count = len(self.records)
+        #(tick, index of the next turn record, game snapshot) every snapshot_interval ticks after the start,
+        #filled in as the replay is played
+        self.snapshots = []
+        #the game seek plays in, made on the first seek and used again for every one after it
+        self.game = None
+
+    #a new game in the replay's starting state
+    def new_game(self):
+        return SnakeGame(self.seed, self.body_class, self.width, self.height)
+
+    def play(self, until = None, game: SnakeGame = None, record = 0):
+        """
+            parameters:
+                until: the tick to stop at (None plays until the game ends, or to the last turn for unfinished replays)
+                game: the game to continue from, with record the index of the next turn record to apply
+                      (defaults to a new game from the start of the replay)
+            return:
+                the game after playing to the given tick
+        """
+        if game is None:
+            game = self.new_game()
+            record = 0
+        records = self.records
+        step = game.step
+        while record < self.turn_count:
+            tick = records[record] >> 3
+            if until is not None and tick >= until:
+                break
+            #go straight until the tick the next turn was made on
+            while game.ticks < tick and not game.game_over:
+                if self.snapshot_interval and game.ticks % self.snapshot_interval == 0:
+                    self.take_snapshot(game, record)
+                step()
+            #the recorded direction is the one the snake ended up moving in, so set it directly
+            game.snake.direction = DIRECTIONS[records[record] & 7]
+            step()
+            record += 1
+        #after the last turn, a finished replay goes straight until the end (an unfinished one stops at its last turn)
+        if until is None:
+            until = self.final_ticks
+        if until is not None:
+            while game.ticks < until and not game.game_over:
+                if self.snapshot_interval and game.ticks % self.snapshot_interval == 0:
+                    self.take_snapshot(game, record)
+                step()
+        return game
+
+    #saves a snapshot of the game at this tick, unless there already is one (the start of the game needs none, since
+    #a new game is just as good). When there are too many, every other one is dropped and the interval doubles
+    def take_snapshot(self, game: SnakeGame, record: int):
+        if game.ticks == 0 or self.snapshots and self.snapshots[-1][0] >= game.ticks:
+            return
+        self.snapshots.append((game.ticks, record, game.snapshot()))
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshot_interval *= 2
+            self.snapshots = [snapshot for snapshot in self.snapshots if snapshot[0] % self.snapshot_interval == 0]
+
+    #returns a game at the given tick, starting from the closest earlier snapshot instead of the beginning.
+    #every seek returns the same game, so a world only has to be made once however often the replay is seeked
+    def seek(self, tick: int):
+        if self.game is None:
+            self.game = self.new_game()
+        game = self.game
+        #snapshots are always added in order of tick, so the closest one can be found with a binary search
+        position = bisect.bisect_right(self.snapshots, tick, key = lambda snapshot: snapshot[0])
+        if position == 0:
+            game.reset(self.seed)
+            return self.play(tick, game, 0)
+        start = self.snapshots[position - 1]
+        game.restore(start[2])
+        return self.play(tick, game, start[1])
+
+    #plays the whole replay and checks it ends the way it did when it was recorded, returning the final game
+    def verify(self):
+        game = self.play()
+        if self.finished:
+            if not game.game_over or game.ticks != self.final_ticks or game.score != self.final_score:
+                raise AssertionError(f"replay ended at tick {game.ticks} with score {game.score}, "
+                                     f"but was recorded ending at tick {self.final_ticks} with score {self.final_score}")
+        return game
+
+    def close(self):
+        if isinstance(self.records, memoryview):
+            self.records.release()
+        self.map.close()
+        self.file.close()
+
+
+#test code that records random games, plays them back and seeks around in them
+def replay_tester(path: str = None):
+    import os
+    import random
+    import tempfile
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), 'test.snkr')
+    rng = random.Random(1353)
+    for game_number in range(20):
+        #record a game, keeping a copy of the state at every tick to compare the replay against
+        game = SnakeGame(game_number, width = 12, height = 10)
+        recorder = ReplayRecorder(path, game)
+        states = [game.get_state()]
+        while not game.game_over:
+            if rng.random() < 0.3:
+                game.snake.queue_turn(rng.choice(DIRECTIONS))
+            state, reward, done = game.step(rng.choice(DIRECTIONS) if rng.random() < 0.1 else None)
+            states.append(state)
+        assert game.recorder is None and recorder.file.closed, 'the recorder should close when the game ends'
+
+        replay = Replay(path, snapshot_interval = 16)
+        assert replay.finished and replay.final_score == game.score, 'the end record should hold the final score'
+        assert os.path.getsize(path) == HEADER.size + 4 * (replay.turn_count + 2), 'each turn should take 4 bytes'
+        played = replay.verify()
+        assert played.get_state() == game.get_state(), 'the replay should end the same way'
+        #seek backwards and forwards, using the snapshots taken during the first playthrough
+        for tick in (len(states) // 2, 0, len(states) - 1, len(states) // 3, 17):
+            if tick < len(states):
+                assert replay.seek(tick).get_state() == states[tick], f'seeking to tick {tick} should match the recording'
+        assert replay.seek(0) is replay.game, 'seeking should reuse one game'
+        replay.close()
+
+    #a long game with room for only a few snapshots keeps them spread out, and seeking still lands on the right tick
+    game = SnakeGame(3, width = 12, height = 10)
+    recorder = ReplayRecorder(path, game)
+    states = [game.get_state()]
+    while not game.game_over:
+        state, reward, done = game.step(rng.choice(DIRECTIONS) if rng.random() < 0.1 else None)
+        states.append(state)
+    replay = Replay(path, snapshot_interval = 1, snapshot_memory = 3 * snapshot_bytes(12, 10))
+    replay.verify()
+    assert 0 < len(replay.snapshots) <= 3 and replay.snapshot_interval > 1, 'the snapshots should be thinned out'
+    assert replay.snapshots[-1][0] > len(states) // 4, 'the snapshots should still cover the game'
+    for tick in range(0, len(states), 7):
+        assert replay.seek(tick).get_state() == states[tick], f'seeking to tick {tick} should match the recording'
+    replay.close()
+    #a big world takes its snapshots further apart
+    ReplayRecorder(path, SnakeGame(3, width = 256, height = 256)).close()
+    replay = Replay(path, snapshot_interval = 16)
+    assert replay.snapshot_interval == 256 * 256 // SQUARES_PER_TICK, 'big worlds should take snapshots further apart'
+    replay.close()
+
+    #a game reset partway through (r in the interactive game) keeps the turns recorded so far, without an end record
+    game = SnakeGame(7, width = 12, height = 10)
+    recorder = ReplayRecorder(path, game)
+    states = [game.get_state()]
+    for action in ('left', None, 'down', None, None, 'right', 'up'):
+        state, reward, done = game.step(action)
+        states.append(state)
+    game.reset(8)
+    assert game.recorder is None and recorder.file.closed, 'reset should close the recorder'
+    replay = Replay(path)
+    assert not replay.finished and replay.turn_count == 4, 'the turns before the reset should be in the file'
+    assert replay.play().get_state() == states[-1], 'the replay should reach the last recorded turn'
+    replay.close()
+
+    #seeds that don't fit in the header are refused before the file is touched, and a file that isn't a replay is
+    #closed again before the error comes out
+    os.remove(path)
+    for seed in (-1, 2 ** 64):
+        try:
+            ReplayRecorder(path, SnakeGame(seed, width = 12, height = 10))
+            assert False, f'recording a game with seed {seed} should fail'
+        except ValueError:
+            assert not os.path.exists(path), 'a refused recording should not create the file'
+    for data in (b'SNKX' + bytes(16), HEADER.pack(MAGIC, VERSION, 12, 10, 0, 1) + b'\0', b'SN'):
+        with open(path, 'wb') as f:
+            f.write(data)
+        try:
+            Replay(path)
+            assert False, 'reading a broken replay should fail'
+        except ValueError:
+            pass
+        #on Windows a file that is still open can't be removed, so this also checks it was closed
+        os.remove(path)
+
+    print('All tests passed!')
+
+
+if __name__ == '__main__':
+    replay_tester()
@@ -0,0 +1,305 @@
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from sanger_project1_TheGameOfSnake import KEY_DIRECTIONS, SnakeGame
+
+"""
+    Plays many seeded games of one policy headless, spread over a pool of worker processes:
+
+        python snake_tournament.py --policy autopilot --games 1000 --output autopilot.jsonl
+
+    Every finished game is written to the output file as one line of JSON (seed, score, length, ticks, cause of death)
+    as soon as it comes back from a worker, so the file doubles as a checkpoint: run again with --resume and only the
+    seeds that aren't in the file yet are played. The first line of the file holds the settings of the run (policy,
+    world size, max ticks and script), and a run only resumes a file with the same settings. At the end the results
+    are summed up in a report with the score distribution, the causes of death and how many games and ticks per second
+    the pool got through.
+
+    The autopilot searches a fixed number of squares per decision here instead of using a time budget, so every game
+    depends only on its seed and can be played again exactly, whichever worker plays it and however busy the machine is.
+"""
+
+POLICIES = ('autopilot', 'random', 'scripted')
+#the keys the scripted policy presses, one per tick and repeated forever ('.' keeps going straight)
+DEFAULT_SCRIPT = 'wwwddd'
+#how often (in games) the runner prints its progress
+PROGRESS_INTERVAL = 100
+#how many squares the autopilot may search per decision, about what its default 2 ms time budget gets through
+AUTOPILOT_NODE_BUDGET = 4096
+
+#the autopilot of this worker process, kept between games so its search arrays are only allocated once
+autopilot = None
+
+
+def make_policy(name: str, seed: int, script: str = DEFAULT_SCRIPT):
+    """
+        parameters:
+            name: one of POLICIES
+            seed: the seed of the game the policy is going to play (random uses it so games can be played again)
+            script: the keys the scripted policy presses
+        return:
+            a function taking the game and returning the action to pass to game.step
+    """
+    global autopilot
+    if name == 'autopilot':
+        if autopilot is None:
+            from snake_autopilot import Autopilot
+            autopilot = Autopilot(node_budget = AUTOPILOT_NODE_BUDGET)
+        return autopilot.choose
+    if name == 'random':
+        #turns a quarter of the time, to a random direction
+        rng = random.Random(seed)
+        return lambda game: rng.choice(('up', 'down', 'left', 'right')) if rng.random() < 0.25 else None
+    if name == 'scripted':
+        if not script:
+            raise ValueError("The scripted policy needs a script of at least one key")
+        actions = [KEY_DIRECTIONS.get(key) for key in script]
+        return lambda game: actions[game.ticks % len(actions)]
+    raise ValueError(f"Unknown policy {name!r}, expected one of {', '.join(POLICIES)}")
+
+
+#returns why the game ended: 'won', 'wall', 'self' (ran into its own body) or 'max ticks' if it hasn't ended
+def cause_of_death(game: SnakeGame):
+    if not game.game_over:
+        return 'max ticks'
+    if game.won:
+        return 'won'
+    head = game.snake.body.first()
+    return 'self' if game.snake.grid.in_bounds(head.x_loc, head.y_loc) else 'wall'
+
+
+def play(task):
+    """
+        parameters:
+            task: a tuple (policy name, seed, width, height, max_ticks, script)
+        return:
+            a dictionary with the result of playing that game to the end (or max_ticks)
+        this is what the worker processes run, so it only takes and returns things that can be pickled
+    """
+    name, seed, width, height, max_ticks, script = task
+    start = time.perf_counter()
+    game = SnakeGame(seed, width = width, height = height)
+    policy = make_policy(name, seed, script)
+    step = game.step
+    while not game.game_over and game.ticks < max_ticks:
+        step(policy(game))
+    return {
+        'seed': seed,
+        'score': game.score,
+        'length': game.snake.body.get_size(),
+        'ticks': game.ticks,
+        'cause': cause_of_death(game),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+#reads the settings line and the games already in a results file, dropping a last line that was cut off when an earlier
+#run was stopped. Returns (None, []) when the file doesn't exist yet
+def load_checkpoint(path: str):
+    settings = None
+    results = []
+    if not os.path.exists(path):
+        return settings, results
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if 'settings' in entry:
+                settings = entry['settings']
+            else:
+                results.append(entry)
+    #write back only the complete lines, so new results are appended after a clean line
+    with open(path, 'w') as f:
+        if settings is not None:
+            f.write(json.dumps({'settings': settings}) + '\n')
+        for result in results:
+            f.write(json.dumps(result) + '\n')
+    return settings, results
+
+
+def run_tournament(policy: str, seeds, width: int = 20, height: int = 20, max_ticks: int = None, workers: int = None,
+                   output: str = None, resume: bool = False, script: str = DEFAULT_SCRIPT, progress = sys.stderr):
+    """
+        parameters:
+            policy: the name of the policy to play with (one of POLICIES)
+            seeds: the seeds of the games to play
+            width, height: the size of the world
+            max_ticks: games still going after this many ticks are stopped (defaults to 200 ticks per square)
+            workers: the number of worker processes (defaults to one per core, 1 plays in this process)
+            output: a file to write each result to as a line of JSON as soon as it's in
+            resume: keep the results already in output and only play the missing seeds. Raises a ValueError if
+                    output was written with different settings
+            script: the keys the scripted policy presses
+            progress: where to print progress, or None to stay quiet
+        return:
+            the list of per-game results (in the order they finished) and the report from summarize
+    """
+    if max_ticks is None:
+        max_ticks = 200 * width * height
+    if workers is None:
+        workers = os.cpu_count() or 1
+    #check the policy here, so a bad one fails before any file is opened instead of in every worker
+    if policy != 'autopilot':
+        make_policy(policy, 0, script)
+    #everything besides the seed that decides how a game plays out
+    settings = {'policy': policy, 'width': width, 'height': height, 'max_ticks': max_ticks, 'script': script}
+    saved, results = load_checkpoint(output) if output is not None and resume else (None, [])
+    #a checkpoint from before the settings line was added can't be checked, so it isn't resumed either
+    if (saved is not None or results) and saved != settings:
+        raise ValueError(f"{output} was played with {saved}, not {settings}")
+    done = {result['seed'] for result in results}
+    tasks = [(policy, seed, width, height, max_ticks, script) for seed in seeds if seed not in done]
+    out = open(output, 'a' if saved is not None else 'w') if output is not None else None
+    if out is not None and saved is None:
+        out.write(json.dumps({'settings': settings}) + '\n')
+    start = time.perf_counter()
+    played = []
+    pool = None
+    try:
+        if workers == 1:
+            finished = map(play, tasks)
+        else:
+            pool = multiprocessing.Pool(workers)
+            #games take about as long as each other, so hand them out a few at a time to keep the pipes quiet
+            chunksize = max(1, min(16, len(tasks) // (workers * 8)))
+            finished = pool.imap_unordered(play, tasks, chunksize)
+        for result in finished:
+            played.append(result)
+            if out is not None:
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+            if progress is not None and len(played) % PROGRESS_INTERVAL == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{len(played)}/{len(tasks)} games, {len(played) / elapsed:,.1f} games/sec", file = progress)
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if out is not None:
+            out.close()
+    elapsed = time.perf_counter() - start
+    results += played
+    report = summarize(results)
+    report['policy'] = policy
+    report['workers'] = workers
+    #throughput only counts the games played by this run, not the ones loaded from the checkpoint
+    report['wall_seconds'] = elapsed
+    report['games_per_sec'] = len(played) / elapsed if elapsed > 0 else 0.0
+    report['ticks_per_sec'] = sum(result['ticks'] for result in played) / elapsed if elapsed > 0 else 0.0
+    return results, report
+
+
+#sums up a list of per-game results
+def summarize(results):
+    scores = sorted(result['score'] for result in results)
+    causes = {}
+    for result in results:
+        causes[result['cause']] = causes.get(result['cause'], 0) + 1
+    count = len(results)
+    return {
+        'games': count,
+        'mean_score': sum(scores) / count if count else 0.0,
+        'median_score': scores[count // 2] if count else 0,
+        'max_score': scores[-1] if count else 0,
+        'mean_length': sum(result['length'] for result in results) / count if count else 0.0,
+        'mean_ticks': sum(result['ticks'] for result in results) / count if count else 0.0,
+        'causes': causes,
+    }
+
+
+#test code that plays a small tournament in a pool, checks it matches playing the games one at a time,
+#then checks a cut off run can be resumed
+def tournament_tester():
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), 'results.jsonl')
+    for policy in POLICIES:
+        results, report = run_tournament(policy, range(12), 10, 10, 2000, workers = 1, progress = None)
+        pooled, pooled_report = run_tournament(policy, range(12), 10, 10, 2000, workers = 3, output = path, progress = None)
+        strip = lambda results: sorted((result['seed'], result['score'], result['ticks'], result['cause']) for result in results)
+        assert strip(results) == strip(pooled), f'{policy} games played in the pool should match playing them one by one'
+        assert pooled_report['causes'] == report['causes'], 'the reports should agree'
+        assert report['games'] == pooled_report['games'] == 12, 'every seed should be played once'
+        assert all(result['cause'] in ('won', 'wall', 'self', 'max ticks') for result in results), 'unknown cause of death'
+    #an empty script is refused before any game is played
+    try:
+        run_tournament('scripted', range(2), 10, 10, workers = 1, script = '', progress = None)
+        assert False, 'an empty script should fail'
+    except ValueError:
+        pass
+    #cut the last run off halfway through a line, then resume it
+    with open(path) as f:
+        lines = f.readlines()
+    with open(path, 'w') as f:
+        f.writelines(lines[:6])
+        f.write(lines[6][:10])
+    #a run with other settings can't carry on from the file
+    try:
+        run_tournament('scripted', range(12), 12, 10, workers = 1, output = path, resume = True, progress = None)
+        assert False, 'resuming with a different world size should fail'
+    except ValueError:
+        pass
+    resumed, report = run_tournament('scripted', range(12), 10, 10, 2000, workers = 2, output = path, resume = True, progress = None)
+    assert report['games'] == 12 and report['games_per_sec'] > 0, 'resuming should only play the missing games'
+    assert strip(resumed) == strip(pooled), 'the resumed games should match the ones that were cut off'
+    settings, results = load_checkpoint(path)
+    assert settings['policy'] == 'scripted' and sorted(result['seed'] for result in results) == list(range(12)), \
+        'the checkpoint should end up with the settings and every seed exactly once'
+    os.remove(path)
+
+    print('All tests passed!')
+
+
+#turns '0-99' into range(0, 100) and '5' into [5]
+def parse_seeds(text: str):
+    if '-' in text:
+        first, last = text.split('-')
+        return range(int(first), int(last) + 1)
+    return [int(text)]
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Play many seeded snake games of a policy across all cores')
+    parser.add_argument('--policy', choices = POLICIES, default = 'autopilot', help = 'what steers the snake')
+    parser.add_argument('--games', type = int, default = 100, help = 'number of games to play, with seeds 0 up (default 100)')
+    parser.add_argument('--seeds', type = parse_seeds, nargs = '+', help = 'seeds to play instead of --games, like 0-999 or 7')
+    parser.add_argument('--width', type = int, default = 20, help = 'width of the world in squares (default 20)')
+    parser.add_argument('--height', type = int, default = 20, help = 'height of the world in squares (default 20)')
+    parser.add_argument('--max-ticks', type = int, help = 'stop games that last longer than this (default 200 per square)')
+    parser.add_argument('--workers', type = int, help = 'worker processes (default: one per core)')
+    parser.add_argument('--script', default = DEFAULT_SCRIPT, help = 'keys the scripted policy presses in a loop, . for none')
+    parser.add_argument('--output', help = 'write each game to this file as a line of JSON as it finishes')
+    parser.add_argument('--resume', action = 'store_true', help = 'keep the games already in --output and play the rest')
+    parser.add_argument('--report', help = 'also write the report to this JSON file')
+    parser.add_argument('--test', action = 'store_true', help = 'run the tests instead')
+    args = parser.parse_args(argv)
+    if args.test:
+        tournament_tester()
+        return
+    if args.resume and args.output is None:
+        parser.error('--resume needs --output')
+    if args.output is not None and os.path.exists(args.output) and not args.resume:
+        parser.error(f'{args.output} already exists, use --resume to continue it')
+    seeds = [seed for group in args.seeds for seed in group] if args.seeds else range(args.games)
+    try:
+        results, report = run_tournament(args.policy, seeds, args.width, args.height, args.max_ticks, args.workers,
+                                         args.output, args.resume, args.script)
+    except ValueError as error:
+        parser.error(str(error))
+    print(json.dumps(report, indent = 1))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent = 1)
+
+
+if __name__ == '__main__':
+    main()